@@ -0,0 +1,150 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import List
+import json
+import time
+
+from InventoryHandler import InventoryHandler, MAX_COMPRESSION
+from Item import Item
+
+# A rules file is a JSON list of rules, applied in order to every file:
+#   {"action": "remove", "id": "minecraft:bedrock"}
+#   {"action": "remove", "slot": 8}
+#   {"action": "replace", "id": "minecraft:stone", "new_id": "minecraft:dirt"}
+#   {"action": "replace", "slot": 0, "new_id": "minecraft:bread", "count": 16}
+#   {"action": "add", "id": "minecraft:torch", "count": 64, "slot": 8}
+# remove and replace match on id, slot or both. add uses the first free
+# hotbar or main inventory slot when no slot is given.
+ACTIONS = ('add', 'remove', 'replace')
+MAIN_SLOTS = range(0, 36)
+
+
+def load_rules(rules_file: Path) -> List[dict]:
+    with open(rules_file, 'r') as file:
+        rules = json.load(file)
+
+    if not isinstance(rules, list):
+        raise ValueError("The rules file must contain a list of rules.")
+    for i, rule in enumerate(rules):
+        action = rule.get('action')
+        if action not in ACTIONS:
+            raise ValueError(f"Rule {i}: action must be one of {ACTIONS}.")
+        if action == 'add' and 'id' not in rule:
+            raise ValueError(f"Rule {i}: add needs an id.")
+        if action != 'add' and 'id' not in rule and 'slot' not in rule:
+            raise ValueError(f"Rule {i}: {action} needs an id or a slot.")
+        if action == 'replace' and 'new_id' not in rule and 'count' not in rule:
+            raise ValueError(f"Rule {i}: replace needs a new_id or a count.")
+    return rules
+
+
+def rule_matches(rule: dict, item: Item):
+    if 'id' in rule and item.id != rule['id']:
+        return False
+    if 'slot' in rule and item.slot != rule['slot']:
+        return False
+    return True
+
+
+def apply_rules(items: List[Item], rules: List[dict]) -> bool:
+    # Applies the rules to items in place, returns whether anything changed
+    changed = False
+    for rule in rules:
+        action = rule['action']
+        if action == 'remove':
+            kept = [item for item in items if not rule_matches(rule, item)]
+            changed |= len(kept) != len(items)
+            items[:] = kept
+        elif action == 'replace':
+            for item in items:
+                if rule_matches(rule, item):
+                    item.id = rule.get('new_id', item.id)
+                    item.count = rule.get('count', item.count)
+                    changed = True
+        elif action == 'add':
+            used = {item.slot for item in items}
+            slot = rule.get('slot')
+            if slot is None:
+                slot = next((s for s in MAIN_SLOTS if s not in used), None)
+            if slot is None or slot in used:
+                # No room for the item, leave the inventory alone
+                continue
+            items.append(Item(slot, rule.get('count', 1), rule['id']))
+            changed = True
+    return changed
+
+
+def process_file(save_file: Path, rules: List[dict], output_dir: Path,
+                 compresslevel: int):
+    # Normally runs in a worker process. Errors are returned rather than raised so one
+    # broken file doesn't stop the rest of the batch.
+    size = 0
+    try:
+        size = save_file.stat().st_size
+        handler = InventoryHandler(save_file)
+        items = handler.get_items()
+        changed = apply_rules(items, rules)
+        if changed or output_dir is not None:
+            target = save_file if output_dir is None \
+                else output_dir / save_file.name
+            handler.write_items(items, target, compresslevel)
+        return save_file, changed, size, None
+    except Exception as e:
+        return save_file, False, size, f"{type(e).__name__}: {e}"
+
+
+def iter_results(save_files: List[Path], rules: List[dict], output_dir: Path,
+                 workers: int, compresslevel: int):
+    # process_file results as they finish. workers=0 runs everything in this
+    # process, which is slower but lets --profile see the work.
+    if workers == 0:
+        for save_file in save_files:
+            yield process_file(save_file, rules, output_dir, compresslevel)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(process_file, save_file, rules, output_dir,
+                            compresslevel)
+            for save_file in save_files
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def run_batch(directory: Path, rules: List[dict], output_dir: Path = None,
+              workers: int = None, compresslevel: int = MAX_COMPRESSION,
+              verbose: bool = True):
+    # Applies rules to every .dat file in directory. Files are edited in
+    # place unless output_dir is given. Returns the list of failed files.
+    save_files = sorted(Path(directory).glob('*.dat'))
+    if output_dir is not None:
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    total_bytes = 0
+    num_changed = 0
+    failed = []
+    results = iter_results(save_files, rules, output_dir, workers, compresslevel)
+    for done, (save_file, changed, size, error) in enumerate(results, 1):
+        total_bytes += size
+        if error is not None:
+            failed.append((save_file, error))
+            status = f"error: {error}"
+        elif changed:
+            num_changed += 1
+            status = "changed"
+        else:
+            status = "unchanged"
+        if verbose:
+            print(f"[{done}/{len(save_files)}] {save_file.name}: {status}")
+
+    elapsed = time.perf_counter() - start
+    if verbose:
+        rate = len(save_files) / elapsed if elapsed > 0 else 0.0
+        mb_rate = total_bytes / 1e6 / elapsed if elapsed > 0 else 0.0
+        print(f"{len(save_files)} files, {num_changed} changed, "
+              f"{len(failed)} failed in {elapsed:.2f}s "
+              f"({rate:.1f} files/sec, {mb_rate:.2f} MB/sec)")
+    return failed
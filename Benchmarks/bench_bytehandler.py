@@ -0,0 +1,83 @@
+# Microbenchmark for the ByteHandler primitive readers.
+# Compares the struct based readers against the old byte at a time versions.
+# Run from the repository root: python Benchmarks/bench_bytehandler.py
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ByteHandler import ByteHandler
+
+
+class PerByteHandler:
+    # The original ByteHandler, kept here only as a baseline
+    def __init__(self, bytes):
+        self.bytes = bytes
+        self.cur_byte = 0
+
+    def read_byte(self):
+        b = self.bytes[self.cur_byte]
+        self.cur_byte += 1
+        return b
+
+    def read_short(self):
+        b1 = self.read_byte()
+        b2 = self.read_byte()
+        return (b1 << 8) + b2
+
+    def read_int(self):
+        b1 = self.read_byte()
+        b2 = self.read_byte()
+        b3 = self.read_byte()
+        b4 = self.read_byte()
+        return (b1 << 24) + (b2 << 16) + (b3 << 8) + b4
+
+    def read_long(self):
+        l = 0
+        for i in range(8):
+            b = self.read_byte()
+            l += (b << (8 - i - 1))
+        return l
+
+    def read_str(self, size):
+        s = ""
+        for i in range(size):
+            s += chr(self.read_byte())
+        return s
+
+
+COUNT = 10000
+STR_SIZE = 24
+
+# name, width in bytes, how to call the reader
+PRIMITIVES = [
+    ('read_short', 2, lambda h: h.read_short()),
+    ('read_int', 4, lambda h: h.read_int()),
+    ('read_long', 8, lambda h: h.read_long()),
+    ('read_str', STR_SIZE, lambda h: h.read_str(STR_SIZE)),
+]
+
+
+def time_reader(handler_type, data, read, repeat):
+    def run():
+        handler = handler_type(data)
+        for i in range(COUNT):
+            read(handler)
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def main():
+    repeat = 5
+    rng = random.Random(0)
+    print(f"{'primitive':<12}{'per-byte':>12}{'struct':>12}{'speedup':>10}")
+    for name, width, read in PRIMITIVES:
+        data = bytes(rng.randrange(32, 127) for i in range(width * COUNT))
+        old = time_reader(PerByteHandler, data, read, repeat)
+        new = time_reader(ByteHandler, data, read, repeat)
+        print(f"{name:<12}{old / COUNT * 1e9:>10.0f}ns{new / COUNT * 1e9:>10.0f}ns"
+              f"{old / new:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Benchmark of the optional C codec (_nbtcodec) against the pure Python
+# reader and writer in Tags.py, parsing and writing every corpus file and
+# the deep compound from bench_tags.py.
+# Run from the repository root after python build_native.py:
+#   python Benchmarks/bench_native.py
+import gzip
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from ByteHandler import ByteHandler
+import Tags
+from Tags import read_tag
+from bench_tags import count_tags, deep_compound, named
+from generate_corpus import SCALES, write_corpus
+
+CORPUS_DIR = Path(__file__).resolve().parent / 'corpus'
+
+
+def best(func, number=5):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def time_both(func):
+    times = []
+    for native in (False, True):
+        Tags.use_native = native
+        times.append(best(func))
+    Tags.use_native = True
+    return times
+
+
+def main():
+    if Tags._nbtcodec is None:
+        print("_nbtcodec isn't built, run python build_native.py first")
+        return 1
+    if not CORPUS_DIR.exists():
+        write_corpus(CORPUS_DIR)
+    cases = {scale: gzip.decompress((CORPUS_DIR / f'{scale}.dat').read_bytes())
+             for scale in SCALES}
+    cases['deep'] = named(10, '', deep_compound(4, 4))
+
+    print(f"{'case':<10}{'tags':>8}{'op':>7}{'python':>12}{'native':>12}{'speedup':>9}")
+    for name, data in cases.items():
+        root = read_tag(ByteHandler(data))
+        num_tags = count_tags(root)
+
+        def parse():
+            read_tag(ByteHandler(data))
+
+        def write():
+            root.write(bytearray())
+
+        for op, func in [('parse', parse), ('write', write)]:
+            python, native = time_both(func)
+            print(f"{name:<10}{num_tags:>8}{op:>7}{python * 1e3:>10.2f}ms"
+                  f"{native * 1e3:>10.2f}ms{python / native:>8.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
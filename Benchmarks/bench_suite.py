@@ -0,0 +1,72 @@
+# pyperf benchmark suite for parsing and writing player files.
+# Generates the synthetic corpus on first use, then times parse, serialize,
+# round trip and write_items for every scale. Typical use, from the
+# repository root:
+#   python Benchmarks/bench_suite.py -o before.json
+#   python Benchmarks/bench_suite.py -o after.json
+#   python -m pyperf compare_to before.json after.json
+# Add --tracemalloc to record peak memory instead of timings.
+# Needs pyperf (pip install pyperf).
+import gzip
+import sys
+import tempfile
+from pathlib import Path
+
+import pyperf
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from ByteHandler import ByteHandler
+from InventoryHandler import InventoryHandler, FAST_COMPRESSION
+from Tags import read_tag
+from generate_corpus import SCALES, write_corpus
+
+CORPUS_DIR = Path(__file__).resolve().parent / 'corpus'
+
+
+def load_handler(path):
+    return InventoryHandler(path)
+
+
+def parse(data):
+    return read_tag(ByteHandler(data))
+
+
+def serialize(root):
+    return root.get_byte_form()
+
+
+def round_trip(data):
+    return read_tag(ByteHandler(data)).get_byte_form()
+
+
+def write_items(handler, items, target):
+    handler.write_items(items, target, FAST_COMPRESSION)
+
+
+def main():
+    runner = pyperf.Runner()
+    runner.metadata['description'] = "NBT parse and write benchmarks"
+
+    paths = [CORPUS_DIR / f'{scale}.dat' for scale in SCALES]
+    if not all(path.exists() for path in paths):
+        paths = write_corpus(CORPUS_DIR)
+
+    target = Path(tempfile.gettempdir()) / 'mcinventoryeditor-bench.dat'
+    for scale, path in zip(SCALES, paths):
+        with gzip.open(path, 'rb') as file:
+            data = file.read()
+        root = parse(data)
+        handler = InventoryHandler(path)
+        items = handler.get_items()
+
+        runner.bench_func(f'{scale}-load', load_handler, path)
+        runner.bench_func(f'{scale}-parse', parse, data)
+        runner.bench_func(f'{scale}-serialize', serialize, root)
+        runner.bench_func(f'{scale}-round-trip', round_trip, data)
+        runner.bench_func(f'{scale}-write-items', write_items,
+                          handler, items, target)
+
+
+if __name__ == '__main__':
+    main()
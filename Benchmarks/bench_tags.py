@@ -0,0 +1,128 @@
+# Benchmark of the per-tag overhead in Tags.py, parsing a synthetic deep
+# compound with the tuple dispatch table and bulk list readers against the
+# old if/elif id_to_tag chain with one read_payload call per list element.
+# Run from the repository root: python Benchmarks/bench_tags.py
+import struct
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ByteHandler import ByteHandler
+from Tags import *
+
+
+def legacy_id_to_tag(id):
+    # The original if/elif chain
+    if id == 0:
+        return TagEnd
+    elif id == 1:
+        return TagByte
+    elif id == 2:
+        return TagShort
+    elif id == 3:
+        return TagInt
+    elif id == 4:
+        return TagLong
+    elif id == 5:
+        return TagFloat
+    elif id == 6:
+        return TagDouble
+    elif id == 7:
+        return TagByteArray
+    elif id == 8:
+        return TagString
+    elif id == 9:
+        return TagList
+    elif id == 10:
+        return TagCompound
+    elif id == 11:
+        return TagIntArray
+    elif id == 12:
+        return TagLongArray
+
+
+def legacy_read_payload(tag, byte_handler):
+    if isinstance(tag, TagCompound):
+        val = []
+        while True:
+            tagid = byte_handler.peek_byte()
+            if tagid == 0:
+                byte_handler.read_byte()
+                break
+            child = legacy_id_to_tag(tagid)()
+            child.tag_type = byte_handler.read_byte()
+            child.read_header(byte_handler)
+            legacy_read_payload(child, byte_handler)
+            val.append(child)
+        tag.val = val
+    elif isinstance(tag, TagList):
+        val = []
+        tag.sub_tag_type = byte_handler.read_byte()
+        TagType = legacy_id_to_tag(tag.sub_tag_type)
+        for i in range(byte_handler.read_int()):
+            child = TagType()
+            legacy_read_payload(child, byte_handler)
+            val.append(child)
+        tag.val = val
+    else:
+        tag.read_payload(byte_handler)
+
+
+def named(tag_type, name, payload):
+    name = name.encode()
+    return struct.pack('>BH', tag_type, len(name)) + name + payload
+
+
+def number_list(name, tag_type, fmt, values):
+    return named(9, name, struct.pack(f'>Bi{len(values)}{fmt}',
+                                      tag_type, len(values), *values))
+
+
+def deep_compound(depth, breadth):
+    # Every level has a few scalars, a string, numeric lists and breadth
+    # child compounds, so the tree has breadth ** depth leaves
+    payload = named(1, 'Byte', b'\x01') + named(3, 'Int', struct.pack('>i', 7))
+    payload += named(6, 'Double', struct.pack('>d', 0.5))
+    payload += named(8, 'Str', struct.pack('>H', 5) + b'value')
+    payload += number_list('Shorts', 2, 'h', range(16))
+    payload += number_list('Ints', 3, 'i', range(16))
+    payload += number_list('Floats', 5, 'f', [0.25] * 16)
+    payload += number_list('Doubles', 6, 'd', [0.5] * 16)
+    if depth > 0:
+        for i in range(breadth):
+            payload += named(10, f'Child{i}', deep_compound(depth - 1, breadth))
+    return payload + b'\x00'
+
+
+def count_tags(tag):
+    n = 1
+    if isinstance(tag, (TagCompound, TagList)):
+        n += sum(count_tags(child) for child in tag.val)
+    return n
+
+
+def main():
+    data = named(10, '', deep_compound(4, 4))
+    num_tags = count_tags(read_tag(ByteHandler(data)))
+
+    def legacy():
+        byte_handler = ByteHandler(data)
+        tag = TagCompound()
+        tag.tag_type = byte_handler.read_byte()
+        tag.read_header(byte_handler)
+        legacy_read_payload(tag, byte_handler)
+
+    def current():
+        read_tag(ByteHandler(data))
+
+    old = min(timeit.repeat(legacy, number=5, repeat=5)) / 5
+    new = min(timeit.repeat(current, number=5, repeat=5)) / 5
+    print(f"{len(data)} bytes, {num_tags} tags")
+    print(f"if/elif + per-element: {old * 1e3:8.2f}ms {old / num_tags * 1e9:6.0f}ns/tag")
+    print(f"dispatch + bulk lists: {new * 1e3:8.2f}ms {new / num_tags * 1e9:6.0f}ns/tag")
+    print(f"speedup: {old / new:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+# Conformance check for the optional C codec (_nbtcodec) against the pure
+# Python reader and writer in Tags.py. Every file in the corpus plus a set
+# of edge cases is parsed and written by both, and the Tag trees and bytes
+# have to match exactly. Exits non-zero on the first difference.
+# Run from the repository root after python build_native.py:
+#   python Benchmarks/check_native.py
+import gzip
+import math
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from ByteHandler import ByteHandler
+import Tags
+from Tags import *
+from generate_corpus import (SCALES, byte, short, int_, long, float_, double,
+                             string, compound, tag, list_payload, array as
+                             array_tag, write_corpus)
+
+CORPUS_DIR = Path(__file__).resolve().parent / 'corpus'
+
+
+def raw_string(n, encoded):
+    # String tag from already encoded modified UTF-8
+    return tag(8, n, struct.pack('>H', len(encoded)) + encoded)
+
+
+def too_deep(depth):
+    # A byte nested in depth compounds inside the root, so the byte's
+    # payload is at depth + 1
+    nested = byte('leaf', 1)
+    for i in range(depth):
+        nested = compound('c', nested)
+    return compound('', nested)
+
+
+def edge_cases():
+    # name -> bytes of one named root compound
+    cases = {}
+    cases['scalars'] = compound(
+        '',
+        byte('min', -128), byte('max', 127), short('s', -32768),
+        int_('i', -2 ** 31), long('l', -2 ** 63), long('lmax', 2 ** 63 - 1),
+        float_('f', -1.5), double('inf', math.inf), double('negzero', -0.0),
+        tag(5, 'nan', struct.pack('>f', math.nan)),
+        tag(6, 'nan2', bytes.fromhex('7ff8000000000001')),
+    )
+    cases['strings'] = compound(
+        '',
+        string('empty', ''), string('ascii', 'minecraft:stone'),
+        string('accents', 'héllo wörld 中文'),
+        raw_string('nul', b'a\xc0\x80b'),
+        raw_string('emoji', b'\xed\xa0\xbc\xed\xbe\x89'),
+        string('long', 'x' * 1000),
+        # A NUL in a tag name
+        bytes([8]) + struct.pack('>H', 6) + b'na\xc0\x80me' + b'\x00\x01x',
+    )
+    cases['lists'] = compound(
+        '',
+        tag(9, 'empty', list_payload(0, [])),
+        tag(9, 'empty_compounds', list_payload(10, [])),
+        tag(9, 'bytes', list_payload(1, [b'\xff', b'\x01'])),
+        tag(9, 'shorts', list_payload(2, [struct.pack('>h', -300)])),
+        tag(9, 'longs', list_payload(4, [struct.pack('>q', -9)] * 3)),
+        tag(9, 'doubles', list_payload(6, [struct.pack('>d', 0.1)])),
+        tag(9, 'strings', list_payload(8, [b'\x00\x01a', b'\x00\x00'])),
+        tag(9, 'arrays', list_payload(7, [struct.pack('>i', 1) + b'\x80'])),
+        tag(9, 'int_arrays', list_payload(11, [struct.pack('>ii', 1, -1)])),
+        tag(9, 'long_arrays', list_payload(12, [struct.pack('>iq', 1, -1)])),
+        tag(9, 'lists', list_payload(9, [list_payload(3, [b'\xff' * 4]),
+                                         list_payload(0, [])])),
+        tag(9, 'compounds', list_payload(10, [b'\x00', byte('Slot', -106) + b'\x00'])),
+    )
+    cases['arrays'] = compound(
+        '',
+        array_tag(7, 'bytes', 'b', [-128, 0, 127]),
+        array_tag(11, 'ints', 'i', [-1, 2 ** 31 - 1]),
+        array_tag(12, 'longs', 'q', [-2 ** 63, 2 ** 63 - 1]),
+        array_tag(12, 'empty', 'q', []),
+    )
+    nested = byte('leaf', 1)
+    for depth in range(100):
+        nested = compound(f'level{depth}', nested)
+    cases['deep'] = compound('', nested)
+    # The deepest nesting both readers accept, one short of Tags.MAX_DEPTH
+    cases['deepest'] = too_deep(MAX_DEPTH - 1)
+    deepest_list = list_payload(1, [b'\x01'])
+    for depth in range(MAX_DEPTH - 1):
+        deepest_list = list_payload(9, [deepest_list])
+    cases['deepest_list'] = tag(9, 'root', deepest_list)
+    cases['scalar_root'] = int_('root', -7)
+    return cases
+
+
+def corpus():
+    if not CORPUS_DIR.exists():
+        write_corpus(CORPUS_DIR)
+    return {f'corpus/{scale}': gzip.decompress((CORPUS_DIR / f'{scale}.dat').read_bytes())
+            for scale in SCALES}
+
+
+def same_value(a, b):
+    if isinstance(a, float) and isinstance(b, float):
+        # Compares the bits, so NaN payloads and -0.0 count
+        return struct.pack('>d', a) == struct.pack('>d', b)
+    if isinstance(a, array) or isinstance(b, array):
+        return type(a) is type(b) and a.typecode == b.typecode and a == b
+    return type(a) is type(b) and a == b
+
+
+def compare(a, b, path='root'):
+    # Raises AssertionError at the first difference between two Tag trees
+    assert type(a) is type(b), f"{path}: {type(a).__name__} != {type(b).__name__}"
+    assert a.tag_type == b.tag_type, f"{path}: tag_type {a.tag_type} != {b.tag_type}"
+    assert same_value(a.name, b.name), f"{path}: name {a.name!r} != {b.name!r}"
+    if isinstance(a, TagList):
+        assert a.sub_tag_type == b.sub_tag_type, f"{path}: sub_tag_type"
+    if isinstance(a, LazyTag):
+        assert a.offset == b.offset, f"{path}: offset {a.offset} != {b.offset}"
+        assert len(a.val) == len(b.val), f"{path}: {len(a.val)} != {len(b.val)} children"
+        for i, (x, y) in enumerate(zip(a.val, b.val)):
+            compare(x, y, f"{path}.{x.name if x.name is not None else i}")
+    else:
+        assert same_value(a.val, b.val), f"{path}: {a.val!r} != {b.val!r}"
+
+
+def parse(data, native):
+    Tags.use_native = native
+    return read_tag(ByteHandler(data))
+
+
+def write(root, native):
+    Tags.use_native = native
+    sink = bytearray()
+    root.write(sink)
+    return bytes(sink)
+
+
+def check(name, data):
+    python_tree = parse(data, False)
+    native_tree = parse(data, True)
+    compare(python_tree, native_tree)
+
+    for tree in (python_tree, native_tree):
+        assert write(tree, False) == data, f"{name}: Python writer differs"
+        assert write(tree, True) == data, f"{name}: native writer differs"
+
+    # Lazily read trees mix decoded and untouched containers
+    Tags.use_native = False
+    lazy = read_tag(ByteHandler(data), lazy=True)
+    if isinstance(lazy, TagCompound) and lazy.val:
+        lazy.val[0].val
+    assert write(lazy, True) == data, f"{name}: native writer differs on a lazy tree"
+
+
+def check_errors():
+    # Both implementations have to reject bad input and bad values
+    truncated = compound('', int_('i', 1))[:-3]
+    unknown = b'\x0a\x00\x00\x0d\x00\x01x\x00'
+    # Negative lengths used to move the cursor backwards and loop forever.
+    # Nested, so the lazy reader has to skip over it.
+    negative_array = compound('', compound('n', tag(11, 'A', struct.pack('>i', -2))))
+    negative_list = compound('', compound('n', tag(9, 'L', struct.pack('>Bi', 1, -1))))
+    for name, data in [('truncated', truncated), ('unknown type', unknown),
+                       ('negative array length', negative_array),
+                       ('negative list length', negative_list),
+                       ('nested too deeply', too_deep(MAX_DEPTH)),
+                       ('nested far too deeply', too_deep(600))]:
+        for native in (False, True):
+            try:
+                parse(data, native)
+            except (IndexError, ValueError, struct.error):
+                continue
+            raise AssertionError(f"{name}: native={native} didn't raise")
+        try:
+            Tags.use_native = False
+            read_tag(ByteHandler(data), lazy=True)
+        except (IndexError, ValueError, struct.error):
+            continue
+        raise AssertionError(f"{name}: the lazy reader didn't raise")
+
+    for bad in [TagByte(1, 'b', 200), TagInt(3, 'i', 2 ** 31),
+                TagString(8, 's', 'x' * 70000)]:
+        for native in (False, True):
+            try:
+                write(TagCompound(10, '', [bad]), native)
+            except struct.error:
+                continue
+            raise AssertionError(f"{bad.name}: native={native} didn't raise")
+
+
+def main():
+    if Tags._nbtcodec is None:
+        print("_nbtcodec isn't built, run python build_native.py first")
+        return 1
+    cases = {**edge_cases(), **corpus()}
+    try:
+        for name, data in cases.items():
+            check(name, data)
+            print(f"ok    {name} ({len(data)} bytes)")
+        check_errors()
+        print("ok    errors")
+    except AssertionError as e:
+        print(f"FAIL  {e}")
+        return 1
+    finally:
+        Tags.use_native = True
+    print(f"{len(cases)} cases match")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
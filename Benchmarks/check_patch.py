@@ -0,0 +1,124 @@
+# Check of the byte-splicing save path, InventoryHandler.patch_inventory.
+# Edits a generated player file where every item carries extra NBT, saves
+# it through write_items and reads the result back. Exits non-zero on the
+# first problem.
+# Run from the repository root: python Benchmarks/check_patch.py
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from ByteHandler import ByteHandler
+from Compression import read_nbt_file
+from InventoryHandler import InventoryHandler
+from Item import Item
+from Tags import read_tag
+from generate_corpus import write_corpus
+
+
+def inventory_of(data):
+    # slot -> (Count, payload bytes of every other tag in the compound) for
+    # the items of a file, in file order
+    root = read_tag(ByteHandler(data))
+    inventory = {}
+    for compound in root.get_path('Inventory').val:
+        count = None
+        rest = bytearray()
+        for tag in compound.val:
+            if tag.name == 'Slot':
+                slot = tag.val
+            elif tag.name == 'Count':
+                count = tag.val
+            else:
+                tag.write(rest)
+        inventory[slot] = (count, bytes(rest))
+    return inventory
+
+
+def outside_inventory(handler, data):
+    # The bytes before and after the inventory list must never change
+    reloaded = InventoryHandler.__new__(InventoryHandler)
+    reloaded.save_file = handler.save_file
+    reloaded.compression = handler.compression
+    reloaded.parse(data)
+    return (bytes(data[:reloaded.inventory_tag_offset]),
+            bytes(data[reloaded.inventory_tag_end:]))
+
+
+def save(handler, items, directory):
+    path = Path(directory) / 'saved.dat'
+    handler.write_items(items, path, verify=True)
+    data, compression = read_nbt_file(path)
+    return bytes(data)
+
+
+def check_unchanged(handler, original, items, directory):
+    assert save(handler, items, directory) == original, \
+        "saving unchanged items changed the file"
+
+
+def check_count_edit(handler, original, items, directory):
+    edited = items[0]
+    items = [Item(item.slot, item.count, item.id) for item in items]
+    items[0].count = edited.count % 64 + 1
+    saved = inventory_of(save(handler, items, directory))
+    before = inventory_of(original)
+    count, rest = saved[edited.slot]
+    assert count == items[0].count, f"slot {edited.slot}: count {count}"
+    assert rest == before[edited.slot][1], \
+        f"slot {edited.slot}: the extra NBT was lost"
+    for slot, item in before.items():
+        if slot != edited.slot:
+            assert saved[slot] == item, f"slot {slot} changed"
+
+
+def check_removal(handler, original, items, directory):
+    removed = items[len(items) // 2]
+    data = save(handler, [item for item in items if item is not removed], directory)
+    saved = inventory_of(data)
+    before = inventory_of(original)
+    assert removed.slot not in saved, f"slot {removed.slot} wasn't removed"
+    del before[removed.slot]
+    assert saved == before, "items next to the removed one changed"
+    assert outside_inventory(handler, data) == outside_inventory(handler, original), \
+        "bytes outside the inventory changed"
+
+
+def check_reorder(handler, original, items, directory):
+    reordered = items[::-1]
+    saved = inventory_of(save(handler, reordered, directory))
+    assert list(saved) == [item.slot for item in reordered], \
+        "items weren't written in the new order"
+    assert saved == inventory_of(original), "reordered items changed"
+
+
+CHECKS = [
+    ('unchanged save is byte-identical', check_unchanged),
+    ('count edit keeps extra NBT', check_count_edit),
+    ('removal keeps the other items', check_removal),
+    ('re-ordered items', check_reorder),
+]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        # The modded scale gives every item an enchantments and ForgeCaps tag
+        player_file = [path for path in write_corpus(directory)
+                       if path.stem == 'modded'][0]
+        handler = InventoryHandler(player_file)
+        original = bytes(handler.bh.view)
+        items = handler.get_items()
+        try:
+            for name, check in CHECKS:
+                check(handler, original, items, directory)
+                print(f"ok    {name}")
+        except AssertionError as e:
+            print(f"FAIL  {e}")
+            return 1
+    print(f"{len(CHECKS)} checks passed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# Generates synthetic gzipped player files for the benchmarks.
+# The files are encoded here with struct directly rather than through
+# Tags.py, so the fixtures don't depend on the code being measured.
+# Run from the repository root: python Benchmarks/generate_corpus.py [DIR]
+import gzip
+import random
+import struct
+import sys
+from pathlib import Path
+
+# Scale name -> description, used for the file names
+SCALES = {
+    'vanilla': "a full vanilla survival inventory",
+    'modded': "a modded inventory where every item carries deep NBT",
+    'arrays': "large byte, int and long arrays",
+}
+
+ITEM_IDS = [
+    'minecraft:diamond', 'minecraft:iron_ingot', 'minecraft:stone',
+    'minecraft:cobblestone', 'minecraft:oak_log', 'minecraft:torch',
+    'minecraft:bread', 'minecraft:diamond_sword', 'minecraft:diamond_pickaxe',
+    'minecraft:bow', 'minecraft:arrow', 'minecraft:redstone',
+]
+ARMOUR_IDS = [
+    'minecraft:diamond_boots', 'minecraft:diamond_leggings',
+    'minecraft:diamond_chestplate', 'minecraft:diamond_helmet',
+]
+
+
+def name(s):
+    b = s.encode('utf-8')
+    return struct.pack('>H', len(b)) + b
+
+
+def tag(tag_type, tag_name, payload):
+    return bytes([tag_type]) + name(tag_name) + payload
+
+
+def byte(n, v):
+    return tag(1, n, struct.pack('>b', v))
+
+
+def short(n, v):
+    return tag(2, n, struct.pack('>h', v))
+
+
+def int_(n, v):
+    return tag(3, n, struct.pack('>i', v))
+
+
+def long(n, v):
+    return tag(4, n, struct.pack('>q', v))
+
+
+def float_(n, v):
+    return tag(5, n, struct.pack('>f', v))
+
+
+def double(n, v):
+    return tag(6, n, struct.pack('>d', v))
+
+
+def string(n, v):
+    return tag(8, n, name(v))
+
+
+def compound(n, *children):
+    return tag(10, n, b''.join(children) + b'\x00')
+
+
+def list_payload(sub_type, payloads):
+    return struct.pack('>Bi', sub_type, len(payloads)) + b''.join(payloads)
+
+
+def array(tag_type, n, fmt, values):
+    return tag(tag_type, n, struct.pack(f'>i{len(values)}{fmt}', len(values), *values))
+
+
+def item(slot, item_id, count, extra=b''):
+    # List items are compounds without a header, so just the payload
+    return byte('Slot', slot) + string('id', item_id) + byte('Count', count) \
+        + extra + b'\x00'
+
+
+def enchantments(rng):
+    return tag(9, 'Enchantments', list_payload(10, [
+        string('id', rng.choice(['minecraft:sharpness', 'minecraft:unbreaking',
+                                 'minecraft:mending', 'minecraft:efficiency']))
+        + short('lvl', rng.randint(1, 5)) + b'\x00'
+        for i in range(rng.randint(1, 4))
+    ]))
+
+
+def mod_nbt(rng, depth):
+    # Nested capability data of the kind mods attach to items
+    children = [
+        string('Owner', f'player-{rng.randrange(1000)}'),
+        int_('Energy', rng.randrange(1 << 20)),
+        double('Progress', rng.random()),
+        tag(9, 'Upgrades', list_payload(8, [
+            name(f'mod:upgrade_{rng.randrange(50)}') for i in range(4)])),
+    ]
+    if depth > 0:
+        children += [compound(f'Module{i}', mod_nbt(rng, depth - 1)[:-1])
+                     for i in range(2)]
+    return b''.join(children) + b'\x00'
+
+
+def inventory(rng, scale):
+    items = []
+    for slot in range(36):
+        if rng.random() < 0.2:
+            continue
+        item_id = rng.choice(ITEM_IDS)
+        extra = b''
+        if scale == 'modded':
+            extra = compound('tag', enchantments(rng),
+                             compound('ForgeCaps', mod_nbt(rng, 4)[:-1]))
+        elif item_id.endswith(('sword', 'pickaxe', 'bow')):
+            extra = compound('tag', int_('Damage', rng.randrange(100)),
+                             enchantments(rng))
+        items.append(item(slot, item_id, rng.randint(1, 64), extra))
+    for slot, item_id in zip(range(100, 104), ARMOUR_IDS):
+        items.append(item(slot, item_id, 1))
+    items.append(item(-106, 'minecraft:shield', 1))
+    return tag(9, 'Inventory', list_payload(10, items))
+
+
+def player(scale, seed=0):
+    # Returns the uncompressed NBT of a player file at the given scale
+    rng = random.Random(seed)
+    children = [
+        int_('DataVersion', 2586),
+        tag(9, 'Pos', list_payload(6, [struct.pack('>d', rng.uniform(-1e4, 1e4))
+                                       for i in range(3)])),
+        tag(9, 'Motion', list_payload(6, [struct.pack('>d', 0.0)] * 3)),
+        tag(9, 'Rotation', list_payload(5, [struct.pack('>f', 0.0)] * 2)),
+        float_('Health', 20.0),
+        short('Fire', 0),
+        int_('XpLevel', rng.randrange(100)),
+        long('WorldUUIDMost', rng.randrange(1 << 62)),
+        array(11, 'UUID', 'i', [rng.randrange(-(1 << 31), 1 << 31) for i in range(4)]),
+        string('Dimension', 'minecraft:overworld'),
+        compound('abilities', byte('flying', 0), byte('mayfly', 0),
+                 float_('walkSpeed', 0.1)),
+        compound('recipeBook', tag(9, 'recipes', list_payload(8, [
+            name(f'minecraft:recipe_{i}') for i in range(300)]))),
+        inventory(rng, scale),
+        tag(9, 'EnderItems', list_payload(10, [
+            item(i, rng.choice(ITEM_IDS), rng.randint(1, 64)) for i in range(27)])),
+    ]
+    if scale == 'arrays':
+        children += [
+            array(7, 'Bytes', 'b', [rng.randrange(-128, 128) for i in range(1 << 16)]),
+            array(11, 'Ints', 'i', [rng.randrange(-(1 << 31), 1 << 31)
+                                    for i in range(1 << 16)]),
+            array(12, 'Longs', 'q', [rng.randrange(-(1 << 63), 1 << 63)
+                                     for i in range(1 << 16)]),
+        ]
+    return compound('', *children)
+
+
+def write_corpus(directory: Path):
+    # Writes one gzipped <scale>.dat per scale, returns their paths
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for scale in SCALES:
+        path = directory / f'{scale}.dat'
+        with gzip.open(path, 'wb') as file:
+            file.write(player(scale))
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else Path('corpus')
+    for path in write_corpus(directory):
+        print(f"{path}: {path.stat().st_size} bytes")
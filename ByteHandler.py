@@ -1,53 +1,175 @@
+from array import array
 import struct
+import sys
+
+# Precompiled big-endian readers, NBT is always stored big-endian. Tag
+# values are signed, only string lengths are unsigned.
+_SBYTE = struct.Struct('>b')
+_SHORT = struct.Struct('>h')
+_USHORT = struct.Struct('>H')
+_INT = struct.Struct('>i')
+_LONG = struct.Struct('>q')
+_FLOAT = struct.Struct('>f')
+_DOUBLE = struct.Struct('>d')
+
+# array.array stores items in native order, which needs swapping on little
+# endian machines
+_SWAP_ARRAYS = sys.byteorder == 'little'
+
+# Tag names and item ids are a few hundred short strings repeated over and
+# over, so those up to INTERN_MAX_SIZE bytes are decoded once and shared.
+# Other string values (custom names, UUIDs, sign text) are mostly unique and
+# are never interned, so they can't fill the table, which stops growing at
+# INTERN_MAX_ENTRIES.
+INTERN_MAX_SIZE = 64
+INTERN_MAX_ENTRIES = 1 << 16
+_interned = {}
+
 
 class ByteHandler:
     def __init__(self, bytes: bytearray):
         self.bytes = bytes
-        self.cur_byte = 0 
+        # All reads go through a memoryview so slicing never copies
+        self.view = memoryview(bytes)
+        self.cur_byte = 0
+        # Nesting depth of the payload being read, kept up to date by the
+        # list and compound readers in Tags.py
+        self.depth = 0
 
     def peek_byte(self):
-        return self.bytes[self.cur_byte]
+        return self.view[self.cur_byte]
 
     def seek(self, num_bytes: int):
         # TODO: Should probably be some kind of check for how far we're going
         self.cur_byte += num_bytes
 
     def read_byte(self):
-        b = self.bytes[self.cur_byte]
+        # Unsigned, for tag type ids. TAG_Byte values use read_sbyte.
+        b = self.view[self.cur_byte]
+        self.cur_byte += 1
+        return b
+
+    def read_sbyte(self):
+        b = _SBYTE.unpack_from(self.view, self.cur_byte)[0]
         self.cur_byte += 1
         return b
 
     def read_short(self):
-        b1 = self.read_byte()
-        b2 = self.read_byte()
-        return (b1 << 8) + b2
+        s = _SHORT.unpack_from(self.view, self.cur_byte)[0]
+        self.cur_byte += 2
+        return s
+
+    def read_ushort(self):
+        # Unsigned, for the lengths of names and strings
+        s = _USHORT.unpack_from(self.view, self.cur_byte)[0]
+        self.cur_byte += 2
+        return s
 
     def read_int(self):
-        b1 = self.read_byte()
-        b2 = self.read_byte()
-        b3 = self.read_byte()
-        b4 = self.read_byte()
-        return (b1 << 24) + (b2 << 16) + (b3 << 8) + b4
+        i = _INT.unpack_from(self.view, self.cur_byte)[0]
+        self.cur_byte += 4
+        return i
+
+    def read_length(self):
+        # Signed int length of a list or array. A negative one would move
+        # the cursor backwards, so corrupt data could loop forever.
+        start = self.cur_byte
+        n = self.read_int()
+        if n < 0:
+            raise ValueError(f"Negative length {n} at byte {start}")
+        return n
 
     def read_long(self):
-        l = 0
-        for i in range(8):
-            b = self.read_byte()
-            l += (b << (8 - i - 1))
+        l = _LONG.unpack_from(self.view, self.cur_byte)[0]
+        self.cur_byte += 8
         return l
 
     def read_float(self):
-        f = struct.unpack('>f', self.bytes[self.cur_byte:self.cur_byte + 4])[0]
+        f = _FLOAT.unpack_from(self.view, self.cur_byte)[0]
         self.cur_byte += 4
         return f
 
     def read_double(self):
-        f = struct.unpack('>d', self.bytes[self.cur_byte:self.cur_byte + 8])[0]
+        f = _DOUBLE.unpack_from(self.view, self.cur_byte)[0]
         self.cur_byte += 8
         return f
 
-    def read_str(self, size):
-        s = ""
-        for i in range(size):
-            s += chr(self.read_byte())
-        return s 
+    def read_bytes(self, size):
+        # Returns a zero-copy slice of the underlying buffer
+        if size < 0:
+            raise ValueError(f"Negative length {size} at byte {self.cur_byte}")
+        b = self.view[self.cur_byte:self.cur_byte + size]
+        self.cur_byte += size
+        return b
+
+    def read_array(self, typecode, count):
+        # Decode count big-endian items into a compact array in one go
+        arr = array(typecode)
+        arr.frombytes(self.read_bytes(count * arr.itemsize))
+        if _SWAP_ARRAYS and arr.itemsize > 1:
+            arr.byteswap()
+        return arr
+
+    def read_values(self, fmt, count):
+        # Unpacks count big-endian values of one struct format character in
+        # a single call, returning a tuple
+        values = struct.Struct(f'>{count}{fmt}')
+        v = values.unpack_from(self.view, self.cur_byte)
+        self.cur_byte += values.size
+        return v
+
+    def read_str(self, size, intern=False):
+        # intern is for tag names and item ids only
+        raw = self.read_bytes(size)
+        if not intern or size > INTERN_MAX_SIZE:
+            return decode_mutf8(raw)
+        try:
+            # Looked up with the view itself, so known strings are never copied
+            s = _interned.get(raw)
+        except ValueError:
+            # Views of writable buffers can't be hashed
+            raw = bytes(raw)
+            s = _interned.get(raw)
+        if s is None:
+            s = decode_mutf8(raw)
+            if len(_interned) < INTERN_MAX_ENTRIES:
+                s = sys.intern(s)
+                _interned[bytes(raw)] = s
+        return s
+
+
+def array_to_bytes(typecode, values):
+    # Big-endian byte form of values, normally an array from read_array
+    if isinstance(values, array) and values.typecode == typecode \
+            and not (_SWAP_ARRAYS and values.itemsize > 1):
+        return values.tobytes()
+    arr = array(typecode, values)
+    if _SWAP_ARRAYS and arr.itemsize > 1:
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def decode_mutf8(raw) -> str:
+    # NBT strings are Java's modified UTF-8, which only differs from UTF-8
+    # for NUL (stored as C0 80) and characters outside the BMP (stored as two
+    # encoded surrogates), so plain UTF-8 is tried first
+    try:
+        return str(raw, 'utf-8')
+    except UnicodeDecodeError:
+        s = bytes(raw).replace(b'\xc0\x80', b'\x00').decode('utf-8', 'surrogatepass')
+        # Join the surrogate pairs back into single characters
+        return s.encode('utf-16-le', 'surrogatepass').decode('utf-16-le', 'surrogatepass')
+
+
+def encode_mutf8(s: str) -> bytes:
+    if s.isascii() and '\x00' not in s:
+        return s.encode('ascii')
+    if any(ord(c) > 0xFFFF for c in s):
+        # Split characters outside the BMP into surrogate pairs
+        s = ''.join(
+            c if ord(c) <= 0xFFFF else
+            chr(0xD800 + ((ord(c) - 0x10000) >> 10))
+            + chr(0xDC00 + ((ord(c) - 0x10000) & 0x3FF))
+            for c in s
+        )
+    return s.encode('utf-8', 'surrogatepass').replace(b'\x00', b'\xc0\x80')
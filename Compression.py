@@ -0,0 +1,75 @@
+from pathlib import Path
+import gzip
+import mmap
+import zlib
+
+# The ways NBT data is stored on disk. Player files and level.dat are gzip,
+# region chunks are usually zlib, and caches or staging copies can be raw.
+GZIP = 'gzip'
+ZLIB = 'zlib'
+NONE = 'none'
+
+# Uncompressed files at least this big are parsed straight from a memory
+# mapping, smaller ones (every player file) are copied into memory. The
+# mapping stays open for as long as the buffer is used, e.g. by a cached
+# InventoryHandler, and Windows can't replace a file that is mapped. Saving
+# a mapped file in place therefore fails there while it is loaded.
+MMAP_MIN_SIZE = 16 * 1024 * 1024
+
+
+def detect_compression(head: bytes) -> str:
+    # Works out the format from the first two bytes of the data
+    if head[:2] == b'\x1f\x8b':
+        return GZIP
+    # zlib header: deflate method, and the two bytes are a multiple of 31
+    if len(head) >= 2 and head[0] & 0x0f == 8 and (head[0] << 8 | head[1]) % 31 == 0:
+        return ZLIB
+    return NONE
+
+
+def decompress(data, compression: str):
+    if compression == GZIP:
+        return gzip.decompress(data)
+    elif compression == ZLIB:
+        return zlib.decompress(data)
+    return data
+
+
+def read_nbt_file(path: Path):
+    # Returns (buffer, compression) for an NBT file in any of the formats.
+    # The file is memory-mapped, so large uncompressed files are parsed
+    # straight from the page cache without being copied into Python memory,
+    # and compressed ones are decompressed without an extra copy of the input.
+    with open(path, 'rb') as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return b'', NONE
+
+    compression = detect_compression(mapped[:2])
+    if compression == NONE and len(mapped) >= MMAP_MIN_SIZE:
+        return mapped, NONE
+    with mapped:
+        if compression == NONE:
+            # Copied, so the file isn't kept mapped and can be saved over
+            return mapped[:], NONE
+        return decompress(mapped, compression), compression
+
+
+def write_compressed(file, chunks, compression: str, compresslevel: int,
+                     name: str = ''):
+    # Writes each bytes-like chunk to the open binary file in the given
+    # format, without joining the chunks first
+    if compression == GZIP:
+        with gzip.GzipFile(name, 'wb', compresslevel, file) as gz:
+            for chunk in chunks:
+                gz.write(chunk)
+    elif compression == ZLIB:
+        compressor = zlib.compressobj(compresslevel)
+        for chunk in chunks:
+            file.write(compressor.compress(chunk))
+        file.write(compressor.flush())
+    else:
+        for chunk in chunks:
+            file.write(chunk)
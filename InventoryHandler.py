@@ -3,40 +3,236 @@ from ByteHandler import ByteHandler
 from Tags import *
 from typing import List
 from Item import Item
-import gzip 
+from Compression import read_nbt_file, write_compressed
+from NbtEvents import iter_events, START_COMPOUND, START_LIST, SCALAR
+import Profiler
+import asyncio
+import os
+import struct
+import tempfile
+
+
+# Where the inventory list lives: player .dat files keep it at the root,
+# level.dat keeps the single player's data under Data.Player
+INVENTORY_PATHS = ['Inventory', 'Data.Player.Inventory']
+
+# Compression levels for saving: fast for iterative edits, max for archiving
+FAST_COMPRESSION = 1
+MAX_COMPRESSION = 9
+
+
+def compound_to_item(compound: TagCompound) -> Item:
+    item = Item()
+    for tag in compound.val:
+        if tag.name == 'Slot':
+            item.slot = tag.val
+        elif tag.name == 'id':
+            item.id = tag.val
+        elif tag.name == 'Count':
+            item.count = tag.val
+    return item
+
+
+def verify_file(save_file: Path):
+    # Checks that any NBT file (player data, level.dat, ...) is written back
+    # byte for byte when parsed. Returns (save_file, first differing offset
+    # or None, error) and doesn't raise, so it can run in worker processes.
+    try:
+        data, compression = read_nbt_file(save_file)
+        return save_file, round_trip_mismatch(data), None
+    except Exception as e:
+        return save_file, None, f"{type(e).__name__}: {e}"
+
+
+def _unpickle_handler(save_file: Path, compression: str, data: bytes):
+    handler = InventoryHandler.__new__(InventoryHandler)
+    handler.save_file = save_file
+    handler.compression = compression
+    handler.parse(data)
+    return handler
 
 
 class InventoryHandler:
     save_file: Path
     inventory_tag_offset: int
+    inventory_tag_end: int
+    compression: str
     bh: ByteHandler
     invtag: TagList
+    root: TagCompound
 
     def __init__(self, save_file: Path):
         # Read the inventory from save_file
         self.save_file = save_file
         self.read_save_file()
 
-        # Read and parse the inventory from the byte handler
-        self.invtag = TagList()
-        self.invtag.read(self.bh)
+    def __reduce__(self):
+        # Pickled as the decompressed file, which is parsed lazily again on
+        # the other side, so handlers can come back from worker processes
+        return _unpickle_handler, (self.save_file, self.compression,
+                                   bytes(self.bh.view))
+
+    @classmethod
+    async def aload(cls, save_file: Path, executor=None):
+        # Loads a save file without blocking the event loop. The file read
+        # and parsing run in executor, the loop's default thread pool if None.
+        # A ProcessPoolExecutor also works and spreads decompression over
+        # several cores, at the cost of sending the file back.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, cls, save_file)
+
+    @classmethod
+    async def aload_many(cls, save_files, limit: int = 8, executor=None):
+        # Async generator that loads save_files with at most limit loads in
+        # flight, yielding (save_file, handler) pairs as each one finishes.
+        # A file that fails to load is yielded with its exception in place of
+        # the handler, like asyncio.gather(return_exceptions=True).
+        semaphore = asyncio.Semaphore(limit)
+
+        async def load(save_file):
+            async with semaphore:
+                try:
+                    return save_file, await cls.aload(save_file, executor)
+                except Exception as e:
+                    return save_file, e
+
+        tasks = [asyncio.ensure_future(load(f)) for f in save_files]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The caller may stop iterating early
+            for task in tasks:
+                task.cancel()
 
     def get_items(self) -> List[Item]:
         # TODO: Should add some form of error handling
+        with Profiler.phase('get_items') as phase:
+            items = self.stream_items()
+            phase.nbytes = self.inventory_tag_end - self.inventory_tag_offset
+        return items
+
+    def stream_items(self) -> List[Item]:
+        # Streams over the inventory bytes rather than building the tags.
+        # depth 1 is the inventory list and depth 2 the item compounds,
+        # anything nested inside the items is skipped.
+        byte_handler = ByteHandler(self.bh.view)
+        byte_handler.seek(self.inventory_tag_offset)
         items = []
-        for compound in self.invtag.val:
-            item = Item()
-            for tag in compound.val:
-                if tag.name == 'Slot':
-                    item.slot = tag.val
-                elif tag.name == 'id':
-                    item.id = tag.val
-                elif tag.name == 'Count':
-                    item.count = tag.val
-            items.append(item)
+        depth = 0
+        for event, name, value in iter_events(byte_handler, max_depth=2):
+            if event == SCALAR:
+                if depth == 2:
+                    if name == 'Slot':
+                        item.slot = value
+                    elif name == 'id':
+                        item.id = value
+                    elif name == 'Count':
+                        item.count = value
+            elif event == START_COMPOUND or event == START_LIST:
+                depth += 1
+                if depth == 2:
+                    item = Item()
+                    items.append(item)
+            else:
+                depth -= 1
         return items
 
-    def write_items(self, items: List[Item], file_to_write: Path):
+    def write_items(self, items: List[Item], file_to_write: Path,
+                    compresslevel: int = MAX_COMPRESSION, verify: bool = False):
+        # With verify set, the new file is parsed and re-encoded before
+        # anything is written, and a ValueError is raised if it doesn't
+        # come back byte for byte
+        with Profiler.phase('serialize'):
+            chunks = self.patch_inventory(items)
+        if verify:
+            with Profiler.phase('verify') as phase:
+                data = b''.join(chunks)
+                phase.nbytes = len(data)
+                try:
+                    offset = round_trip_mismatch(data)
+                except (IndexError, ValueError, struct.error) as e:
+                    raise ValueError(
+                        f"Not saving {file_to_write}: the new file can't be "
+                        f"read back ({type(e).__name__}: {e})") from e
+            if offset is not None:
+                raise ValueError(
+                    f"Not saving {file_to_write}: the new file doesn't "
+                    f"round-trip, first difference at byte {offset}")
+            chunks = [data]
+        self.write_chunks(file_to_write, chunks, compresslevel)
+
+    def verify(self) -> int:
+        # Offset of the first byte that changes when the loaded file is
+        # fully parsed and written again, or None if it round-trips exactly
+        return round_trip_mismatch(self.bh.view)
+
+    def patch_inventory(self, items: List[Item]):
+        # Works out the new file as a list of chunks, comparing items with the
+        # inventory as it was loaded. Items that haven't changed reuse their
+        # original bytes, including any extra tags such as enchantments or
+        # damage. Only changed items are encoded again: a new count keeps the
+        # rest of the original compound, a new id or slot gets a fresh one.
+        loaded = {}
+        for compound in self.invtag.val:
+            loaded[compound_to_item(compound).slot] = compound
+
+        view = self.bh.view
+        header = bytearray(self.invtag.get_header_bytes())
+        sub_tag_type = 10 if items else self.invtag.sub_tag_type
+        header += struct.pack(">Bi", sub_tag_type, len(items))
+        chunks = [view[:self.inventory_tag_offset], header]
+        # (start, end) of the original bytes to copy next, so neighbouring
+        # unchanged items are written as one slice
+        span = None
+        for item in items:
+            compound = loaded.get(item.slot)
+            original = compound_to_item(compound) if compound is not None else None
+            if original is not None and original.id == item.id \
+                    and original.count == item.count \
+                    and compound.offset is not None:
+                if span is not None and span[1] == compound.offset:
+                    span = (span[0], compound.end)
+                    continue
+                if span is not None:
+                    chunks.append(view[span[0]:span[1]])
+                span = (compound.offset, compound.end)
+                continue
+
+            if span is not None:
+                chunks.append(view[span[0]:span[1]])
+                span = None
+            sink = bytearray()
+            if original is not None and original.id == item.id:
+                self.updated_compound(compound, item).write_payload(sink)
+            else:
+                self.new_compound(item).write_payload(sink)
+            chunks.append(sink)
+        if span is not None:
+            chunks.append(view[span[0]:span[1]])
+
+        chunks.append(view[self.inventory_tag_end:])
+        return chunks
+
+    def updated_compound(self, compound: TagCompound, item: Item) -> TagCompound:
+        # Copy of compound with the new count, other tags are shared as is
+        tags = []
+        for tag in compound.val:
+            if tag.name == 'Count':
+                tag = TagByte(tag_type=1, name='Count', val=item.count)
+            tags.append(tag)
+        return TagCompound(tag_type=10, val=tags)
+
+    def new_compound(self, item: Item) -> TagCompound:
+        slotTag = TagByte(tag_type=1, name='Slot', val=item.slot)
+        idTag = TagString(tag_type=8, name='id', val=item.id)
+        countTag = TagByte(tag_type=1, name='Count', val=item.count)
+        return TagCompound(val=[slotTag, idTag, countTag])
+
+    def write_new_inventory(self, items: List[Item], file_to_write: Path,
+                            compresslevel: int = MAX_COMPRESSION):
+        # Rewrites the whole inventory from items, keeping only the Slot, id
+        # and Count of each item
         # Creates a new empty inventory tag based on our old one.
         new_invtag = TagList(
             self.invtag.tag_type, 
@@ -46,37 +242,78 @@ class InventoryHandler:
         )
         for item in items:
             self.inventory_insert_item(new_invtag, item)
-        self.write_save_file(file_to_write, new_invtag)
+        self.write_save_file(file_to_write, new_invtag, compresslevel)
 
     def read_save_file(self):
-        with gzip.open(self.save_file, 'rb') as file:
-            bytes = file.read()
-
-        # Look for the start of the inventory list in the data file
-        self.inventory_tag_offset = bytes.find(b'\x09\x00\x09\x49\x6E\x76\x65\x6E\x74\x6F\x72\x79')
-
-        # Create byte handler and have it seek to where the inventory starts
-        self.bh = ByteHandler(bytes)
-        self.bh.seek(self.inventory_tag_offset)
-
-    def write_save_file(self, new_file_name: str, new_invtag: TagList):
-        newfile = gzip.open(new_file_name, 'wb')
-        bytes = self.bh.bytes 
-
-        # Write all bytes up to the inventory
-        newfile.write(bytes[:self.inventory_tag_offset])
-        # Write our new inventory
-        newfile.write(new_invtag.get_byte_form())
-        # Write everything after the inventory
-        # Since we're using the full file in byte_handler now, cur_byte should
-        # stop at the actual ending of inventory
-        newfile.write(bytes[self.bh.cur_byte:])
-        
-        newfile.close()
+        # gzip, zlib and uncompressed files are all accepted. Uncompressed
+        # files are memory-mapped rather than read into memory.
+        with Profiler.phase('decompress') as phase:
+            bytes, self.compression = read_nbt_file(self.save_file)
+            phase.nbytes = len(bytes)
+        self.parse(bytes)
+
+    def parse(self, bytes):
+        with Profiler.phase('parse') as phase:
+            # Lazily parse the whole file, so other tags (EnderItems, Pos,
+            # ...) can be reached without decoding everything up front
+            self.bh = ByteHandler(bytes)
+            self.root = read_tag(self.bh, lazy=True)
+
+            # Find the inventory list by walking the tag structure. Sibling
+            # subtrees are skipped by length, and nested lists that happen to
+            # be called Inventory (entities, containers) can't be matched by
+            # mistake.
+            self.invtag = self.find_inventory()
+            phase.nbytes = len(bytes)
+        self.inventory_tag_offset = self.invtag.offset
+        self.inventory_tag_end = self.invtag.end
+
+    def find_inventory(self) -> TagList:
+        for path in INVENTORY_PATHS:
+            try:
+                tag = self.root.get_path(path)
+            except KeyError:
+                continue
+            if isinstance(tag, TagList):
+                return tag
+        raise ValueError(f"{self.save_file} does not contain an Inventory list")
+
+    def write_save_file(self, new_file_name: str, new_invtag: TagList,
+                        compresslevel: int = MAX_COMPRESSION):
+        inventory = bytearray()
+        new_invtag.write(inventory)
+
+        # Everything up to the inventory, our new inventory and everything
+        # after it, streamed straight from the original buffer
+        view = self.bh.view
+        self.write_chunks(new_file_name, [
+            view[:self.inventory_tag_offset],
+            inventory,
+            view[self.inventory_tag_end:],
+        ], compresslevel)
+
+    def write_chunks(self, new_file_name: str, chunks, compresslevel: int):
+        path = Path(new_file_name)
+        # Write to a temporary file next to the target and rename it over the
+        # target at the end, so a failed save never leaves a half written file
+        fd, tmp_name = tempfile.mkstemp(
+            dir=path.parent, prefix=path.name + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as newfile, \
+                    Profiler.phase('compress') as phase:
+                # Saved in the same format the file was loaded in
+                write_compressed(newfile, chunks, self.compression,
+                                 compresslevel, path.name)
+                phase.nbytes = sum(len(chunk) for chunk in chunks)
+                newfile.flush()
+                os.fsync(newfile.fileno())
+            # mkstemp creates the file as private, keep the old permissions
+            if path.exists():
+                os.chmod(tmp_name, path.stat().st_mode)
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
 
     def inventory_insert_item(self, invtag: TagList, item: Item):
-        slotTag = TagByte(tag_type=1, name='Slot', val=item.slot)
-        idTag = TagString(tag_type=8, name='id', val=item.id)
-        countTag = TagByte(tag_type=1, name='Count', val=item.count)
-        tag = TagCompound(val=[slotTag, idTag, countTag])
-        invtag.val.append(tag)
+        invtag.val.append(self.new_compound(item))
@@ -0,0 +1,111 @@
+from array import array
+from collections import defaultdict
+from typing import Dict, List
+
+from Item import Item
+from Tags import TagList
+
+
+class InventoryTable:
+    # Columnar store of inventory items, usually gathered from many players.
+    # Each row is one item stack. Instead of one Item object per stack the
+    # slot, count, id and owner of every row are kept in parallel compact
+    # arrays, with ids and owners stored as indices into interned lists.
+    def __init__(self):
+        self.ids: List[str] = []
+        self.owners: List[str] = []
+        self.id_index: Dict[str, int] = {}
+        self.owner_index: Dict[str, int] = {}
+
+        self.id_col = array('i')
+        self.owner_col = array('i')
+        self.slot_col = array('h')
+        self.count_col = array('h')
+
+    def __len__(self):
+        return len(self.id_col)
+
+    def intern_id(self, id: str) -> int:
+        index = self.id_index.get(id)
+        if index is None:
+            index = self.id_index[id] = len(self.ids)
+            self.ids.append(id)
+        return index
+
+    def intern_owner(self, owner: str) -> int:
+        index = self.owner_index.get(owner)
+        if index is None:
+            index = self.owner_index[owner] = len(self.owners)
+            self.owners.append(owner)
+        return index
+
+    def append(self, owner: str, slot: int, count: int, id: str):
+        self.owner_col.append(self.intern_owner(owner))
+        self.slot_col.append(slot)
+        self.count_col.append(count)
+        self.id_col.append(self.intern_id(id))
+
+    def add_items(self, owner: str, items: List[Item]):
+        for item in items:
+            self.append(owner, item.slot, item.count, item.id)
+
+    def add_tag(self, owner: str, invtag: TagList):
+        # Builds rows straight from an inventory list tag, skipping the Item
+        # objects. Compounds missing a Slot, id or Count are ignored.
+        owner_index = self.intern_owner(owner)
+        for compound in invtag.val:
+            slot = count = id = None
+            for tag in compound.val:
+                if tag.name == 'Slot':
+                    slot = tag.val
+                elif tag.name == 'id':
+                    id = tag.val
+                elif tag.name == 'Count':
+                    count = tag.val
+            if slot is None or count is None or id is None:
+                continue
+            self.owner_col.append(owner_index)
+            self.slot_col.append(slot)
+            self.count_col.append(count)
+            self.id_col.append(self.intern_id(id))
+
+    def rows(self, id: str = None, owner: str = None, slot: int = None):
+        # Indices of the rows matching every filter that is given
+        rows = range(len(self))
+        if id is not None:
+            if id not in self.id_index:
+                return []
+            index = self.id_index[id]
+            id_col = self.id_col
+            rows = [r for r in rows if id_col[r] == index]
+        if owner is not None:
+            if owner not in self.owner_index:
+                return []
+            index = self.owner_index[owner]
+            owner_col = self.owner_col
+            rows = [r for r in rows if owner_col[r] == index]
+        if slot is not None:
+            slot_col = self.slot_col
+            rows = [r for r in rows if slot_col[r] == slot]
+        return list(rows)
+
+    def total(self, id: str, owner: str = None) -> int:
+        # Total count of an item, e.g. all diamonds across every player
+        count_col = self.count_col
+        return sum(count_col[r] for r in self.rows(id=id, owner=owner))
+
+    def totals_by_id(self) -> Dict[str, int]:
+        totals = defaultdict(int)
+        for index, count in zip(self.id_col, self.count_col):
+            totals[index] += count
+        return {self.ids[index]: total for index, total in totals.items()}
+
+    def totals_by_owner(self, id: str) -> Dict[str, int]:
+        totals = defaultdict(int)
+        for r in self.rows(id=id):
+            totals[self.owners[self.owner_col[r]]] += self.count_col[r]
+        return dict(totals)
+
+    def get_item(self, row: int) -> Item:
+        return Item(self.slot_col[row], self.count_col[row],
+                    self.ids[self.id_col[row]])
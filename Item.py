@@ -1,4 +1,8 @@
 class Item:
+    # Items are created in bulk when aggregating many inventories, so skip
+    # the per-instance __dict__
+    __slots__ = ('slot', 'count', 'id')
+
     slot: int
     count: int
     id: str
@@ -13,7 +17,7 @@ class Item:
             return False 
 
         if (0 <= self.slot <= 35 or 100 <= self.slot <= 103 or self.slot == -106) \
-            and 0 < self.count <= 255 \
+            and 0 < self.count <= 127 \
             and self.id != '':
             return True 
         return False
@@ -0,0 +1,109 @@
+from pathlib import Path
+from typing import List, Tuple
+import sqlite3
+
+from InventoryHandler import InventoryHandler
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    item_id TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_by_item_id ON items(item_id);
+CREATE INDEX IF NOT EXISTS items_by_file_id ON items(file_id);
+'''
+
+
+class ItemIndex:
+    # On-disk SQLite index mapping item ids to the player files, slots and
+    # counts that hold them. update() only reparses files whose mtime or size
+    # changed since the last run, so queries never touch the save files.
+    def __init__(self, db_file: Path):
+        self.db = sqlite3.connect(str(db_file))
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, directory: Path):
+        # Brings the index in line with the .dat files in directory. Returns
+        # (updated, removed, failed) where failed lists (path, error) pairs.
+        known = {
+            path: (file_id, mtime_ns, size)
+            for file_id, path, mtime_ns, size
+            in self.db.execute('SELECT id, path, mtime_ns, size FROM files')
+        }
+        updated = 0
+        failed = []
+        seen = set()
+        for save_file in sorted(Path(directory).glob('*.dat')):
+            path = str(save_file.resolve())
+            seen.add(path)
+            stat = save_file.stat()
+            entry = known.get(path)
+            if entry is not None and entry[1:] == (stat.st_mtime_ns, stat.st_size):
+                continue
+
+            try:
+                items = InventoryHandler(save_file).get_items()
+            except Exception as e:
+                failed.append((save_file, f"{type(e).__name__}: {e}"))
+                continue
+
+            # Like InventoryTable.add_tag, stacks missing a Slot, id or Count
+            # are skipped, e.g. 1.20.5+ items that spell it count
+            items = [item for item in items
+                     if None not in (item.id, item.slot, item.count)]
+            with self.db:
+                if entry is not None:
+                    self.db.execute('DELETE FROM files WHERE id = ?', (entry[0],))
+                cursor = self.db.execute(
+                    'INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)',
+                    (path, stat.st_mtime_ns, stat.st_size))
+                self.db.executemany(
+                    'INSERT INTO items (file_id, item_id, slot, count) '
+                    'VALUES (?, ?, ?, ?)',
+                    [(cursor.lastrowid, item.id, item.slot, item.count)
+                     for item in items])
+            updated += 1
+
+        # Drop files that have disappeared from this directory
+        directory = Path(directory).resolve()
+        removed = [
+            (file_id,) for path, (file_id, mtime_ns, size) in known.items()
+            if Path(path).parent == directory and path not in seen
+        ]
+        with self.db:
+            self.db.executemany('DELETE FROM files WHERE id = ?', removed)
+        return updated, len(removed), failed
+
+    def query(self, item_id: str) -> List[Tuple[str, int, int]]:
+        # (player file, slot, count) for every stack of item_id
+        return self.db.execute(
+            'SELECT files.path, items.slot, items.count FROM items '
+            'JOIN files ON files.id = items.file_id '
+            'WHERE items.item_id = ? ORDER BY files.path, items.slot',
+            (item_id,)).fetchall()
+
+    def totals(self, item_id: str) -> List[Tuple[str, int]]:
+        # (player file, total count) of item_id, largest holders first
+        return self.db.execute(
+            'SELECT files.path, SUM(items.count) AS total FROM items '
+            'JOIN files ON files.id = items.file_id '
+            'WHERE items.item_id = ? GROUP BY files.path ORDER BY total DESC',
+            (item_id,)).fetchall()
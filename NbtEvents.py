@@ -0,0 +1,87 @@
+from ByteHandler import ByteHandler
+from Tags import skip_payload
+
+# Event types yielded by iter_events, as (event, name, value) tuples.
+# name is None for the items of a list. value is None for start/end
+# events, except START_LIST whose value is (item tag type, length).
+START_COMPOUND = 'start_compound'
+END_COMPOUND = 'end_compound'
+START_LIST = 'start_list'
+END_LIST = 'end_list'
+SCALAR = 'scalar'
+
+# Value readers for every tag that isn't a list or a compound, matching the
+# values the tag classes in Tags.py store. The methods are looked up on each
+# call, so the wrappers Profiler.enable() installs are counted too.
+VALUE_READERS = {
+    1: lambda bh: bh.read_sbyte(),
+    2: lambda bh: bh.read_short(),
+    3: lambda bh: bh.read_int(),
+    4: lambda bh: bh.read_long(),
+    5: lambda bh: bh.read_float(),
+    6: lambda bh: bh.read_double(),
+    7: lambda bh: bh.read_array('b', bh.read_length()),
+    8: lambda bh: bh.read_str(bh.read_ushort()),
+    11: lambda bh: bh.read_array('i', bh.read_length()),
+    12: lambda bh: bh.read_array('q', bh.read_length()),
+}
+
+# Marks a compound on the stack, lists are [item tag type, items left]
+_COMPOUND = None
+
+
+def iter_events(byte_handler: ByteHandler, tag_type: int = None,
+                max_depth: int = None):
+    # Generates events for one tag straight from byte_handler, without
+    # building any Tag objects. Reads a complete named tag by default, or
+    # just a payload of tag_type. Only the current nesting is kept, so memory
+    # use doesn't grow with the file, and callers can stop at any point.
+    # Lists and compounds nested more than max_depth deep are skipped over
+    # by length without producing any events.
+    name = None
+    if tag_type is None:
+        tag_type = byte_handler.read_byte()
+        name = byte_handler.read_str(byte_handler.read_ushort(), intern=True)
+
+    stack = []
+    while True:
+        if tag_type in (9, 10) and max_depth is not None \
+                and len(stack) >= max_depth:
+            skip_payload(byte_handler, tag_type)
+        elif tag_type == 10:
+            yield START_COMPOUND, name, None
+            stack.append(_COMPOUND)
+        elif tag_type == 9:
+            sub_tag_type = byte_handler.read_byte()
+            list_size = byte_handler.read_length()
+            yield START_LIST, name, (sub_tag_type, list_size)
+            stack.append([sub_tag_type, list_size])
+        elif tag_type == 8 and name == 'id':
+            # Item ids are interned like tag names
+            yield SCALAR, name, byte_handler.read_str(byte_handler.read_ushort(),
+                                                      intern=True)
+        else:
+            yield SCALAR, name, VALUE_READERS[tag_type](byte_handler)
+
+        # Find the next tag to read, closing any containers that are done
+        tag_type = None
+        while stack and tag_type is None:
+            frame = stack[-1]
+            if frame is _COMPOUND:
+                tagid = byte_handler.read_byte()
+                if tagid == 0:
+                    stack.pop()
+                    yield END_COMPOUND, None, None
+                else:
+                    tag_type = tagid
+                    name = byte_handler.read_str(byte_handler.read_ushort(),
+                                                 intern=True)
+            elif frame[1] == 0:
+                stack.pop()
+                yield END_LIST, None, None
+            else:
+                frame[1] -= 1
+                tag_type = frame[0]
+                name = None
+        if tag_type is None:
+            return
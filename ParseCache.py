@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from pathlib import Path
+import os
+import threading
+
+from InventoryHandler import InventoryHandler
+
+
+class ParseCache:
+    # LRU cache of loaded InventoryHandlers. Entries are keyed by the resolved
+    # path and checked against the file's mtime and size, so loading an
+    # unchanged file again skips both the gzip read and tag decoding. The
+    # cache is bounded by max_bytes, counted as the decompressed size of each
+    # file, and evicts the least recently used files first.
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        # path -> (mtime_ns, size, handler, cost), least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, save_file: Path) -> InventoryHandler:
+        path = os.path.realpath(save_file)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        # Parse outside the lock so other threads can keep using the cache
+        handler = InventoryHandler(Path(save_file))
+        cost = len(handler.bh.bytes)
+        with self.lock:
+            self.remove_entry(path)
+            if cost <= self.max_bytes:
+                self.entries[path] = (stat.st_mtime_ns, stat.st_size, handler, cost)
+                self.current_bytes += cost
+                while self.current_bytes > self.max_bytes:
+                    self.remove_entry(next(iter(self.entries)))
+                    self.evictions += 1
+        return handler
+
+    def __contains__(self, save_file: Path):
+        with self.lock:
+            return os.path.realpath(save_file) in self.entries
+
+    def remove_entry(self, path: str):
+        # Caller must hold the lock
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.current_bytes -= entry[3]
+
+    def invalidate(self, save_file: Path):
+        with self.lock:
+            self.remove_entry(os.path.realpath(save_file))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,155 @@
+from collections import defaultdict
+import functools
+import time
+
+from ByteHandler import ByteHandler
+import Tags
+
+# Opt-in instrumentation for finding where load and save time goes. While
+# disabled nothing is wrapped, so the only cost left is the phase() calls,
+# which happen a few times per file. enable() wraps the ByteHandler readers
+# and the read_payload of every tag class, and turns on phase timing.
+# Work done in worker processes (batch, containers) isn't recorded.
+
+# ByteHandler methods that are counted when profiling
+READ_METHODS = [
+    'read_byte', 'read_sbyte', 'read_short', 'read_ushort', 'read_int',
+    'read_long', 'read_float', 'read_double', 'read_bytes', 'read_array',
+    'read_values', 'read_str',
+]
+
+
+class Counter:
+    __slots__ = ('count', 'bytes', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def add(self, nbytes, seconds):
+        self.count += 1
+        self.bytes += nbytes
+        self.seconds += seconds
+
+
+class Stats:
+    # Counts, bytes and cumulative seconds, per phase (decompress, parse,
+    # compress, ...), per tag type and per ByteHandler read method. Times
+    # for container tags include their children.
+    def __init__(self):
+        self.phases = defaultdict(Counter)
+        self.tags = defaultdict(Counter)
+        self.reads = defaultdict(Counter)
+
+    def reset(self):
+        # Zeroed in place, the installed wrappers hold on to their counters
+        for counters in (self.phases, self.tags, self.reads):
+            for counter in counters.values():
+                counter.__init__()
+
+    def report(self) -> str:
+        lines = []
+        for title, counters in [('phase', self.phases), ('tag type', self.tags),
+                                ('read', self.reads)]:
+            used = [(name, c) for name, c in counters.items() if c.count]
+            if not used:
+                continue
+            lines.append(f"{title:<16}{'count':>10}{'bytes':>14}{'seconds':>12}")
+            for name, c in sorted(used, key=lambda kv: -kv[1].seconds):
+                lines.append(f"{name:<16}{c.count:>10}{c.bytes:>14}{c.seconds:>12.6f}")
+            lines.append('')
+        return '\n'.join(lines)
+
+
+stats = Stats()
+enabled = False
+_originals = []
+_native = False
+
+
+class Phase:
+    # Times a with block into stats.phases. Set nbytes inside the block to
+    # record how much data the phase handled.
+    def __init__(self, name):
+        self.name = name
+        self.nbytes = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stats.phases[self.name].add(self.nbytes, time.perf_counter() - self.start)
+
+
+class NullPhase:
+    # Stand-in used while profiling is off
+    nbytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_phase = NullPhase()
+
+
+def phase(name: str):
+    if not enabled:
+        return _null_phase
+    return Phase(name)
+
+
+def timed_read(method, counter):
+    @functools.wraps(method)
+    def wrapper(byte_handler, *args, **kwargs):
+        start_byte = byte_handler.cur_byte
+        start = time.perf_counter()
+        result = method(byte_handler, *args, **kwargs)
+        counter.add(byte_handler.cur_byte - start_byte, time.perf_counter() - start)
+        return result
+    return wrapper
+
+
+def timed_payload(method, counter):
+    @functools.wraps(method)
+    def wrapper(tag, byte_handler, *args, **kwargs):
+        start_byte = byte_handler.cur_byte
+        start = time.perf_counter()
+        result = method(tag, byte_handler, *args, **kwargs)
+        counter.add(byte_handler.cur_byte - start_byte, time.perf_counter() - start)
+        return result
+    return wrapper
+
+
+def enable():
+    global enabled, _native
+    if enabled:
+        return
+    enabled = True
+    # The C codec would bypass the wrapped methods
+    _native = Tags.use_native
+    Tags.use_native = False
+    for name in READ_METHODS:
+        method = getattr(ByteHandler, name)
+        _originals.append((ByteHandler, name, method))
+        setattr(ByteHandler, name, timed_read(method, stats.reads[name]))
+    for TagType in Tags.TAG_TYPES:
+        # Only wrap classes that define their own read_payload
+        if 'read_payload' in vars(TagType):
+            method = TagType.read_payload
+            _originals.append((TagType, 'read_payload', method))
+            TagType.read_payload = timed_payload(method, stats.tags[TagType.__name__])
+
+
+def disable():
+    global enabled
+    while _originals:
+        cls, name, method = _originals.pop()
+        setattr(cls, name, method)
+    if enabled:
+        Tags.use_native = _native
+    enabled = False
@@ -0,0 +1,149 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import List
+import mmap
+import struct
+
+from ByteHandler import ByteHandler
+from Compression import GZIP, ZLIB, NONE, decompress
+from InventoryHandler import compound_to_item
+from Tags import TagCompound, TagList, read_tag
+
+SECTOR_SIZE = 4096
+CHUNKS_PER_REGION = 32 * 32
+# Compression type byte stored in front of each chunk
+CHUNK_COMPRESSION = {1: GZIP, 2: ZLIB, 3: NONE}
+# Number of chunks handed to a worker process at a time
+CHUNKS_PER_TASK = 64
+
+_LOCATIONS = struct.Struct(f'>{CHUNKS_PER_REGION}I')
+_CHUNK_HEADER = struct.Struct('>IB')
+
+
+class RegionFile:
+    # Reader for Anvil region (.mca) files. The file is memory-mapped and the
+    # first 4 KiB sector holds the location of each of the 32x32 chunks: a 3
+    # byte sector offset followed by a 1 byte sector count.
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as file:
+            try:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty region files exist and simply have no chunks
+                self.map = b''
+        self.view = memoryview(self.map)
+
+        self.locations = [0] * CHUNKS_PER_REGION
+        if len(self.view) >= SECTOR_SIZE:
+            self.locations = list(_LOCATIONS.unpack_from(self.view, 0))
+
+    def close(self):
+        self.view.release()
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def chunk_indices(self) -> List[int]:
+        # Indices (x + z * 32 within the region) of the chunks that exist
+        return [i for i, location in enumerate(self.locations) if location]
+
+    def read_chunk_bytes(self, index: int):
+        location = self.locations[index]
+        if not location:
+            raise KeyError(f"Chunk {index} is not present in {self.path}")
+        offset = (location >> 8) * SECTOR_SIZE
+        length, compression_type = _CHUNK_HEADER.unpack_from(self.view, offset)
+        compression = CHUNK_COMPRESSION.get(compression_type)
+        if compression is None:
+            # LZ4 and chunks stored in external .mcc files aren't supported
+            raise ValueError(f"Chunk {index} in {self.path} uses unsupported "
+                             f"compression type {compression_type}")
+        # length counts the compression type byte
+        data = self.view[offset + 5:offset + 4 + length]
+        if compression == NONE:
+            # Copy so chunks don't keep the mapping open
+            return bytes(data)
+        return decompress(data, compression)
+
+    def read_chunk(self, index: int) -> TagCompound:
+        # The chunk's root compound, read lazily so only the parts that are
+        # used get decoded
+        return read_tag(ByteHandler(self.read_chunk_bytes(index)), lazy=True)
+
+
+def container_items(chunk: TagCompound):
+    # Yields (container id, x, y, z, Item) for every item stored in the
+    # block entities of a chunk, including the contents of shulker boxes
+    # kept inside other containers
+    block_entities = chunk.get('block_entities')
+    if block_entities is None:
+        # Chunks from before 1.18 keep them under Level.TileEntities
+        level = chunk.get('Level')
+        block_entities = level.get('TileEntities') if level is not None else None
+    if not isinstance(block_entities, TagList):
+        return
+
+    for block_entity in block_entities.val:
+        if not isinstance(block_entity, TagCompound) or 'Items' not in block_entity:
+            continue
+        container_id = block_entity.get('id')
+        position = [block_entity.get(axis) for axis in 'xyz']
+        if container_id is None or None in position:
+            continue
+        x, y, z = (tag.val for tag in position)
+        yield from list_items(container_id.val, x, y, z, block_entity['Items'])
+
+
+def list_items(container_id: str, x: int, y: int, z: int, items: TagList):
+    for compound in items.val:
+        item = compound_to_item(compound)
+        yield container_id, x, y, z, item
+        # Shulker boxes carry their contents in tag.BlockEntityTag.Items
+        try:
+            nested = compound.get_path('tag.BlockEntityTag.Items')
+        except KeyError:
+            continue
+        if isinstance(nested, TagList):
+            yield from list_items(item.id, x, y, z, nested)
+
+
+def read_chunk_items(path: Path, indices: List[int]):
+    # Runs in a worker process: decodes a batch of chunks from one region
+    # file. Returns the item records and (path, index, error) for chunks that
+    # could not be read, so one bad chunk doesn't lose the rest.
+    records = []
+    errors = []
+    with RegionFile(path) as region:
+        for index in indices:
+            try:
+                records.extend(container_items(region.read_chunk(index)))
+            except Exception as e:
+                errors.append((path, index, f"{type(e).__name__}: {e}"))
+    return records, errors
+
+
+def iter_container_items(region_files: List[Path], workers: int = None,
+                         errors: list = None):
+    # Streams (container id, x, y, z, Item) records for every container in
+    # region_files, decoding chunks in a process pool. Chunks that fail are
+    # appended to errors as (path, index, message) when a list is given.
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for path in region_files:
+            with RegionFile(path) as region:
+                indices = region.chunk_indices()
+            for i in range(0, len(indices), CHUNKS_PER_TASK):
+                futures.append(executor.submit(
+                    read_chunk_items, path, indices[i:i + CHUNKS_PER_TASK]))
+
+        for future in as_completed(futures):
+            records, chunk_errors = future.result()
+            if errors is not None:
+                errors.extend(chunk_errors)
+            yield from records
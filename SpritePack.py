@@ -0,0 +1,267 @@
+from pathlib import Path
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+# A sprite pack is the item sprite sheet cut up ahead of time, so the GUI
+# doesn't have to load the whole sheet to show a few items. Build it with
+#   python SpritePack.py [items-28.png] [Scraping/mcid_to_index.csv] [items-28.pack]
+# The layout, all big-endian:
+#   header   magic, version, sprite count, id count
+#   sources  size and CRC-32 of the sheet and the id csv it was built from
+#   sprites  (offset, length) of every sprite's PNG data
+#   ids      (sprite number, name length, name) for every item id
+#   data     one small PNG per sprite, offsets are from the start of the file
+MAGIC = b'MCSP'
+VERSION = 2
+
+SHEET_FILE = 'items-28.png'
+INDEX_FILE = 'Scraping/mcid_to_index.csv'
+PACK_FILE = 'items-28.pack'
+SPRITE_SIZE = 32
+
+_HEADER = struct.Struct('>4sBII')
+_SOURCE = struct.Struct('>QI')
+_SPRITE_ENTRY = struct.Struct('>II')
+_ID_ENTRY = struct.Struct('>IH')
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_CHUNK_HEADER = struct.Struct('>I4s')
+_IHDR = struct.Struct('>IIBBBBB')
+# Bytes per pixel of the 8 bit colour types: greyscale, RGB, grey + alpha
+# and RGBA. Palette images aren't supported.
+_PNG_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+
+
+class SpritePack:
+    # Reads a sprite pack by memory-mapping it. Only the index is read up
+    # front, sprite data stays in the file until a sprite is asked for.
+    def __init__(self, path: Path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        try:
+            self.read_index(path)
+        except struct.error as e:
+            # The pack ends early, e.g. after an interrupted build
+            self.close()
+            raise ValueError(f"{path} is truncated") from e
+        except ValueError:
+            self.close()
+            raise
+
+    def read_index(self, path: Path):
+        magic, version, num_sprites, num_ids = _HEADER.unpack_from(self.view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} sprite pack")
+        pos = _HEADER.size
+        self.sources = [_SOURCE.unpack_from(self.view, pos),
+                        _SOURCE.unpack_from(self.view, pos + _SOURCE.size)]
+        pos += 2 * _SOURCE.size
+        self.sprites = list(_SPRITE_ENTRY.iter_unpack(
+            self.view[pos:pos + num_sprites * _SPRITE_ENTRY.size]))
+        pos += num_sprites * _SPRITE_ENTRY.size
+
+        # Item id to sprite number
+        self.sprite_of_id = {}
+        for _ in range(num_ids):
+            sprite, name_length = _ID_ENTRY.unpack_from(self.view, pos)
+            pos += _ID_ENTRY.size
+            name = str(self.view[pos:pos + name_length], 'utf-8')
+            pos += name_length
+            self.sprite_of_id[name] = sprite
+
+        if any(offset + length > len(self.view) for offset, length in self.sprites) \
+                or any(sprite >= len(self.sprites) for sprite in self.sprite_of_id.values()):
+            raise ValueError(f"{path} is truncated")
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+    def is_stale(self, sheet_file: Path = SHEET_FILE,
+                 index_file: Path = INDEX_FILE) -> bool:
+        # True if the sheet or the id csv changed since the pack was built,
+        # new ids would have no sprite. Missing sources aren't checked.
+        for path, source in zip((sheet_file, index_file), self.sources):
+            if Path(path).is_file() and source_stamp(path) != source:
+                return True
+        return False
+
+    def __contains__(self, minecraft_id):
+        return minecraft_id in self.sprite_of_id
+
+    def sprite_png(self, sprite: int) -> memoryview:
+        offset, length = self.sprites[sprite]
+        return self.view[offset:offset + length]
+
+
+def source_stamp(path: Path):
+    # (size, CRC-32) of a file the pack is built from
+    data = Path(path).read_bytes()
+    return len(data), zlib.crc32(data)
+
+
+def read_png(path: Path):
+    # Decodes a non-interlaced 8 bit PNG into (width, height, channels,
+    # rows), with each row a bytes object of width * channels bytes
+    data = Path(path).read_bytes()
+    if not data.startswith(_PNG_SIGNATURE):
+        raise ValueError(f"{path} is not a PNG file")
+
+    pos = len(_PNG_SIGNATURE)
+    header = None
+    compressed = []
+    while pos < len(data):
+        length, chunk_type = _PNG_CHUNK_HEADER.unpack_from(data, pos)
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if chunk_type == b'IHDR':
+            header = _IHDR.unpack(chunk)
+        elif chunk_type == b'IDAT':
+            compressed.append(chunk)
+        elif chunk_type == b'IEND':
+            break
+
+    width, height, depth, colour_type, _, _, interlace = header
+    if depth != 8 or colour_type not in _PNG_CHANNELS or interlace:
+        raise ValueError(f"{path}: only non-interlaced 8 bit PNGs are supported")
+    channels = _PNG_CHANNELS[colour_type]
+
+    raw = zlib.decompress(b''.join(compressed))
+    stride = width * channels
+    rows = []
+    prior = bytearray(stride)
+    for r in range(height):
+        start = r * (stride + 1)
+        row = unfilter(raw[start], bytearray(raw[start + 1:start + 1 + stride]),
+                       prior, channels)
+        rows.append(bytes(row))
+        prior = row
+    return width, height, channels, rows
+
+
+def unfilter(filter_type, row, prior, bpp):
+    # Undoes one of the five PNG scanline filters in place
+    if filter_type == 0:
+        pass
+    elif filter_type == 1:
+        for i in range(bpp, len(row)):
+            row[i] = (row[i] + row[i - bpp]) & 0xFF
+    elif filter_type == 2:
+        for i in range(len(row)):
+            row[i] = (row[i] + prior[i]) & 0xFF
+    elif filter_type == 3:
+        for i in range(len(row)):
+            left = row[i - bpp] if i >= bpp else 0
+            row[i] = (row[i] + ((left + prior[i]) >> 1)) & 0xFF
+    elif filter_type == 4:
+        for i in range(len(row)):
+            a = row[i - bpp] if i >= bpp else 0
+            b = prior[i]
+            c = prior[i - bpp] if i >= bpp else 0
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            if pa <= pb and pa <= pc:
+                predictor = a
+            elif pb <= pc:
+                predictor = b
+            else:
+                predictor = c
+            row[i] = (row[i] + predictor) & 0xFF
+    else:
+        raise ValueError(f"Unknown PNG filter type {filter_type}")
+    return row
+
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return (_PNG_CHUNK_HEADER.pack(len(data), chunk_type) + data
+            + struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+
+def write_png(width, height, channels, rows) -> bytes:
+    # Encodes rows as an unfiltered 8 bit PNG, which Tk can load directly
+    colour_type = {v: k for k, v in _PNG_CHANNELS.items()}[channels]
+    raw = b''.join(b'\x00' + row for row in rows)
+    return b''.join([
+        _PNG_SIGNATURE,
+        png_chunk(b'IHDR', _IHDR.pack(width, height, 8, colour_type, 0, 0, 0)),
+        png_chunk(b'IDAT', zlib.compress(raw, 9)),
+        png_chunk(b'IEND', b''),
+    ])
+
+
+def load_index(index_file: Path):
+    # mcid_to_index.csv maps each item id to its position in the sheet
+    mcid_to_index = {}
+    with open(index_file, 'r') as file:
+        for line in file:
+            mcid, raw_index = line.split(',')
+            mcid_to_index[mcid] = int(raw_index)
+    return mcid_to_index
+
+
+def build_pack(sheet_file: Path, index_file: Path, pack_file: Path):
+    width, height, channels, rows = read_png(sheet_file)
+    sprites_per_row = width // SPRITE_SIZE
+    mcid_to_index = load_index(index_file)
+
+    # Ids that share a picture in the sheet share a sprite in the pack
+    sheet_indices = sorted(set(mcid_to_index.values()))
+    sprite_of_index = {index: n for n, index in enumerate(sheet_indices)}
+
+    sprite_data = []
+    for index in sheet_indices:
+        l = (index % sprites_per_row) * SPRITE_SIZE * channels
+        t = (index // sprites_per_row) * SPRITE_SIZE
+        sprite_rows = [rows[t + r][l:l + SPRITE_SIZE * channels]
+                       for r in range(SPRITE_SIZE)]
+        sprite_data.append(write_png(SPRITE_SIZE, SPRITE_SIZE, channels,
+                                     sprite_rows))
+
+    ids = bytearray()
+    for mcid, index in mcid_to_index.items():
+        name = mcid.encode('utf-8')
+        ids += _ID_ENTRY.pack(sprite_of_index[index], len(name)) + name
+    offset = (_HEADER.size + 2 * _SOURCE.size
+              + len(sprite_data) * _SPRITE_ENTRY.size + len(ids))
+    sprites = bytearray()
+    for data in sprite_data:
+        sprites += _SPRITE_ENTRY.pack(offset, len(data))
+        offset += len(data)
+
+    # Written next to the pack and renamed over it at the end, so an
+    # interrupted build never leaves a truncated pack behind
+    pack_file = Path(pack_file)
+    fd, tmp_name = tempfile.mkstemp(
+        dir=pack_file.parent, prefix=pack_file.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(_HEADER.pack(MAGIC, VERSION, len(sprite_data),
+                                    len(mcid_to_index)))
+            for path in (sheet_file, index_file):
+                file.write(_SOURCE.pack(*source_stamp(path)))
+            file.write(sprites)
+            file.write(ids)
+            for data in sprite_data:
+                file.write(data)
+        os.replace(tmp_name, pack_file)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return len(sprite_data), len(mcid_to_index)
+
+
+def main():
+    # Paths not given on the command line use the defaults
+    defaults = [SHEET_FILE, INDEX_FILE, PACK_FILE]
+    args = sys.argv[1:4]
+    sheet_file, index_file, pack_file = args + defaults[len(args):]
+    num_sprites, num_ids = build_pack(sheet_file, index_file, pack_file)
+    print(f"Wrote {num_sprites} sprites for {num_ids} ids to {pack_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,51 @@
 from abc import ABC, abstractmethod
 import struct
-from ByteHandler import ByteHandler
+from ByteHandler import ByteHandler, array_to_bytes, decode_mutf8, encode_mutf8, \
+    INTERN_MAX_SIZE, INTERN_MAX_ENTRIES
+
+# The optional C codec (python build_native.py) does eager reads and all
+# writes of whole trees when it's built. use_native can be turned off to
+# force the pure Python code, which the profiler does as it counts per tag.
+try:
+    import _nbtcodec
+except ImportError:
+    _nbtcodec = None
+use_native = _nbtcodec is not None
+
+# Precompiled packers shared by every tag when serializing
+_BYTE = struct.Struct(">b")
+_SHORT = struct.Struct(">h")
+_USHORT = struct.Struct(">H")
+_INT = struct.Struct(">i")
+_LONG = struct.Struct(">q")
+_FLOAT = struct.Struct(">f")
+_DOUBLE = struct.Struct(">d")
+_LIST_HEADER = struct.Struct(">Bi")
+
+# Lists and compounds nested deeper than this are treated as corrupt, like
+# Minecraft does. _nbtcodec.c has the same limit, so both readers accept the
+# same files.
+MAX_DEPTH = 512
+
+# Encoded length and bytes of tag names, which are the same few hundred
+# strings every time
+_encoded_names = {}
+
+
+def encode_name(name: str) -> bytes:
+    encoded = _encoded_names.get(name)
+    if encoded is None:
+        b = encode_mutf8(name)
+        encoded = _USHORT.pack(len(b)) + b
+        if len(_encoded_names) < INTERN_MAX_ENTRIES:
+            _encoded_names[name] = encoded
+    return encoded
 
 class Tag(ABC):
+    # struct format character of the payload for the fixed size scalar tags,
+    # used to decode whole lists of them with a single unpack
+    bulk_format = None
+
     def __init__(self, tag_type=None, name=None, val=None):
         self.tag_type = tag_type
         self.name = name 
@@ -15,40 +58,101 @@ class Tag(ABC):
 
     def read_header(self, byte_handler: ByteHandler):
         # Read short for the length of the name 
-        name_size = byte_handler.read_short()
-        name = byte_handler.read_str(name_size)
+        name_size = byte_handler.read_ushort()
+        name = byte_handler.read_str(name_size, intern=True)
         self.name = name
 
     @abstractmethod
     def read_payload(self, byte_handler: ByteHandler):
         pass
 
-    def get_header_bytes(self):
-        byte_form = b''
-        # Get the tag type byte
-        byte_form += struct.pack(">B", self.tag_type)
-        # Get the length of the name
-        byte_form += struct.pack(">H", len(self.name))
-        # Get the name bytes
-        byte_form += self.name.encode('ascii')
-        return byte_form
+    # Serializing works by appending to one shared bytearray (the sink), so
+    # a whole tree is written in a single pass with no intermediate bytes
+    def write_header(self, sink: bytearray):
+        # The tag type byte, then the length of the name and the name
+        sink.append(self.tag_type)
+        sink += encode_name(self.name)
 
     @abstractmethod
-    def get_payload_bytes(self):
+    def write_payload(self, sink: bytearray):
         pass
 
-    # @abstractmethod
+    def write(self, sink: bytearray):
+        if use_native:
+            _nbtcodec.write(self, sink)
+            return
+        self.write_header(sink)
+        self.write_payload(sink)
+
+    def get_header_bytes(self):
+        sink = bytearray()
+        self.write_header(sink)
+        return bytes(sink)
+
+    def get_payload_bytes(self):
+        sink = bytearray()
+        self.write_payload(sink)
+        return bytes(sink)
+
     def get_byte_form(self):
-        return self.get_header_bytes() + self.get_payload_bytes()
+        sink = bytearray()
+        self.write(sink)
+        return bytes(sink)
 
     def __str__(self):
         return f"{self.tag_type}, {self.name}, {self.val}"
 
 
+class LazyTag(Tag):
+    # Base class for the container tags (lists and compounds), which can be
+    # read lazily. A lazily read container only records where its payload
+    # sits in the source buffer and is decoded the first time val is used.
+    # Containers that are never touched are written back byte for byte.
+    deferred = None
+    offset = None
+    end = None
+    depth = 0
+
+    @property
+    def val(self):
+        if self.deferred is not None:
+            self.materialize()
+        return self._val
+
+    @val.setter
+    def val(self, val):
+        self.deferred = None
+        self._val = val
+
+    def defer_payload(self, byte_handler: ByteHandler, offset: int):
+        # offset is where the whole tag starts in the buffer, including the
+        # header when it has one
+        start = byte_handler.cur_byte
+        self.depth = byte_handler.depth
+        skip_payload(byte_handler, self.tag_type)
+        self.offset = offset
+        self.end = byte_handler.cur_byte
+        self.deferred = (byte_handler.view, start, self.end)
+
+    def materialize(self):
+        view, start, end = self.deferred
+        byte_handler = ByteHandler(view)
+        byte_handler.seek(start)
+        byte_handler.depth = self.depth
+        # Only decodes one level, nested containers are deferred again
+        self.read_payload(byte_handler, lazy=True)
+
+    def write_deferred(self, sink: bytearray):
+        view, start, end = self.deferred
+        sink += view[start:end]
+
+    def is_deferred(self):
+        return self.deferred is not None
+
+
 class TagEnd(Tag):
-    def __init__(self):
-        super()
-        self.tag_type = 0
+    def __init__(self, tag_type=0, name=None, val=None):
+        super().__init__(0, name, val)
     
     def read(self, byte_handler: ByteHandler):
         self.tag_type = byte_handler.read_byte()
@@ -56,170 +160,153 @@ class TagEnd(Tag):
     def read_payload(self, byte_handler: ByteHandler):
         pass
 
-    def get_payload_bytes(self):
-        return b''
+    def write_payload(self, sink: bytearray):
+        pass
 
-    def get_byte_form(self):
-        return struct.pack(">B", 0)
+    def write(self, sink: bytearray):
+        sink.append(0)
 
 
 class TagByte(Tag):
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
+    bulk_format = 'b'
 
     def read_payload(self, byte_handler: ByteHandler):
-        self.val = byte_handler.read_byte()
+        self.val = byte_handler.read_sbyte()
 
-    def get_payload_bytes(self):
-        return struct.pack(">B", self.val)
+    def write_payload(self, sink: bytearray):
+        sink += _BYTE.pack(self.val)
 
 
 class TagShort(Tag):
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
+    bulk_format = 'h'
 
     def read_payload(self, byte_handler: ByteHandler):
         self.val = byte_handler.read_short()
 
-    def get_payload_bytes(self):
-        return struct.pack(">h", self.val)
+    def write_payload(self, sink: bytearray):
+        sink += _SHORT.pack(self.val)
 
 
 class TagInt(Tag):
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
+    bulk_format = 'i'
 
     def read_payload(self, byte_handler: ByteHandler):
         self.val = byte_handler.read_int()
 
-    def get_payload_bytes(self):
-        return struct.pack(">i", self.val)
+    def write_payload(self, sink: bytearray):
+        sink += _INT.pack(self.val)
 
 
 class TagLong(Tag):
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
+    bulk_format = 'q'
 
     def read_payload(self, byte_handler: ByteHandler):
         self.val = byte_handler.read_long()
 
-    def get_playload_bytes(self):
-        return struct.pack(">l", self.val)
+    def write_payload(self, sink: bytearray):
+        sink += _LONG.pack(self.val)
 
 
 class TagFloat(Tag):
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
+    bulk_format = 'f'
 
     def read_payload(self, byte_handler: ByteHandler):
         self.val = byte_handler.read_float()
 
-    def get_payload_bytes(self):
-        return struct.pack(">f", self.val)
+    def write_payload(self, sink: bytearray):
+        sink += _FLOAT.pack(self.val)
 
 
 class TagDouble(Tag):
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
+    bulk_format = 'd'
 
     def read_payload(self, byte_handler: ByteHandler):
         self.val = byte_handler.read_double()
 
-    def get_payload_bytes(self):
-        return struct.pack(">d", self.val)
+    def write_payload(self, sink: bytearray):
+        sink += _DOUBLE.pack(self.val)
 
 
 class TagByteArray(Tag):
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
-
     def read_payload(self, byte_handler: ByteHandler):
-        arr_size = byte_handler.read_int()
-        self.val = []
-        for i in range(arr_size):
-            # These tags will only store the payloads
-            new_tag = TagByte()
-            new_tag.read_payload(byte_handler)
-            self.val.append(new_tag)
+        arr_size = byte_handler.read_length()
+        # Stored as a compact array of signed bytes rather than TagBytes
+        self.val = byte_handler.read_array('b', arr_size)
 
-    def get_payload_bytes(self):
-        b = b''
-        # Write the int size of the byte array
-        b += struct.pack(">i", len(self.val))
-        # Write size bytes
-        for byte in self.val:
-            b += struct.pack(">B", byte)
-        return b
+    def write_payload(self, sink: bytearray):
+        # Write the int size of the byte array followed by the bytes
+        sink += _INT.pack(len(self.val))
+        sink += array_to_bytes('b', self.val)
 
     def __str__(self):
         s = f"Byte Array '{self.name}': {self.val}"
         return s 
 
 
-class TagString(Tag):    
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
-
+class TagString(Tag):
     def read_payload(self, byte_handler: ByteHandler):
-        # Read short for the length of the string 
-        length = byte_handler.read_short()
-        self.val = byte_handler.read_str(length)
+        # Read unsigned short for the length of the string
+        length = byte_handler.read_ushort()
+        # Item ids repeat like names do, other strings are mostly unique
+        self.val = byte_handler.read_str(length, intern=self.name == 'id')
 
-    def get_payload_bytes(self):
-        b = b''
-        # Write the unsigned short size of the byte array
-        b += struct.pack(">H", len(self.val))
-        # Write size bytes
-        b += self.val.encode('ascii')
-        return b
+    def write_payload(self, sink: bytearray):
+        # The length is of the modified UTF-8 bytes, not the characters
+        b = encode_mutf8(self.val)
+        # Write the unsigned short size of the string, then the string
+        sink += _USHORT.pack(len(b))
+        sink += b
 
 
-class TagList(Tag):
+class TagList(LazyTag):
     def __init__(self, tag_type=None, name=None, val=None, sub_tag_type=None):
         super().__init__(tag_type, name, val)
         self.sub_tag_type = sub_tag_type
 
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
-
-    def read_payload(self, byte_handler: ByteHandler):
-        self.val = []
+    def read_payload(self, byte_handler: ByteHandler, lazy=False):
+        val = []
         self.sub_tag_type = byte_handler.read_byte()
-        list_size = byte_handler.read_int()
+        list_size = byte_handler.read_length()
         TagType = id_to_tag(self.sub_tag_type)
+        depth = byte_handler.depth
+        if list_size and depth >= MAX_DEPTH:
+            raise ValueError("NBT data is nested too deeply")
+        if TagType.bulk_format is not None:
+            # Lists of numbers are decoded with one unpack for the whole list
+            values = byte_handler.read_values(TagType.bulk_format, list_size)
+            self.val = [TagType(self.sub_tag_type, None, v) for v in values]
+            return
+        defer = lazy and issubclass(TagType, LazyTag)
+        byte_handler.depth = depth + 1
         for i in range(list_size):
             tag = TagType()
-            tag.read_payload(byte_handler)
-            self.val.append(tag)
+            tag.tag_type = self.sub_tag_type
+            if defer:
+                tag.defer_payload(byte_handler, byte_handler.cur_byte)
+            else:
+                tag.read_payload(byte_handler)
+            val.append(tag)
+        byte_handler.depth = depth
+        self.val = val
 
-    def get_payload_bytes(self):
-        b = b''
-        # Write the tag type for the list items
-        b += struct.pack(">B", self.sub_tag_type)
-        # Write the int size of the byte array
-        b += struct.pack(">i", len(self.val))
+    def defer_payload(self, byte_handler: ByteHandler, offset: int):
+        # The item type is the first payload byte, so it stays known
+        self.sub_tag_type = byte_handler.peek_byte()
+        super().defer_payload(byte_handler, offset)
+
+    def write_payload(self, sink: bytearray):
+        if use_native:
+            _nbtcodec.write_payload(self, sink)
+            return
+        if self.deferred is not None:
+            self.write_deferred(sink)
+            return
+        val = self.val
+        # Write the tag type for the list items and the int size of the list
+        sink += _LIST_HEADER.pack(self.sub_tag_type, len(val))
         # Write size tags of type sub_tag_type
-        for tag in self.val:
-            b += tag.get_payload_bytes()
-        return b
+        for tag in val:
+            tag.write_payload(sink)
 
     def __str__(self):
         # TODO: Shouldn't print self.name if it is just going to be null
@@ -229,35 +316,84 @@ class TagList(Tag):
         return s
 
 
-class TagCompound(Tag):
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
-
-    def read_payload(self, byte_handler: ByteHandler):
-        self.val = []
+class TagCompound(LazyTag):
+    def read_payload(self, byte_handler: ByteHandler, lazy=False):
+        val = []
+        depth = byte_handler.depth
+        byte_handler.depth = depth + 1
         while True:
-            tagid = byte_handler.peek_byte()
+            start = byte_handler.cur_byte
+            tagid = byte_handler.read_byte()
             # If reached TAG_END
             if tagid == 0:
-                byte_handler.read_byte()
                 break
+            if depth >= MAX_DEPTH:
+                raise ValueError("NBT data is nested too deeply")
 
-            TagType = id_to_tag(tagid)
+            try:
+                TagType = TAG_TYPES[tagid]
+            except IndexError:
+                raise ValueError(f"Unknown tag type {tagid}")
             tag = TagType()
-            tag.read(byte_handler)
-            self.val.append(tag)
+            tag.tag_type = tagid
+            tag.read_header(byte_handler)
+            if lazy and issubclass(TagType, LazyTag):
+                tag.defer_payload(byte_handler, start)
+            else:
+                tag.read_payload(byte_handler)
+            val.append(tag)
+        byte_handler.depth = depth
+        self.val = val
 
-    def get_payload_bytes(self):
-        b = b''
-        # Write all complete tags we have
+    def write_payload(self, sink: bytearray):
+        if use_native:
+            _nbtcodec.write_payload(self, sink)
+            return
+        if self.deferred is not None:
+            self.write_deferred(sink)
+            return
+        # Write all complete tags we have. Header and payload are written
+        # here rather than through tag.write, so each level of nesting takes
+        # one stack frame and MAX_DEPTH deep trees stay under the recursion
+        # limit.
         for tag in self.val:
-            b += tag.get_byte_form()
+            tag.write_header(sink)
+            tag.write_payload(sink)
         # And last, we'll write the TAG_END
-        tag = TagEnd()
-        b += tag.get_byte_form()
-        return b
+        sink.append(0)
+
+    def __getitem__(self, name: str) -> Tag:
+        # Looks up a direct child by name. On a lazily read compound this
+        # only decodes this level, sibling subtrees stay skipped.
+        for tag in self.val:
+            if tag.name == name:
+                return tag
+        raise KeyError(name)
+
+    def __contains__(self, name: str):
+        return any(tag.name == name for tag in self.val)
+
+    def get(self, name: str, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def get_path(self, path: str) -> Tag:
+        # Follows a dotted path such as "Data.Player.Inventory". Parts that
+        # step into a list are used as indices, e.g. "Inventory.0.id".
+        tag = self
+        for part in path.split('.'):
+            if isinstance(tag, TagCompound):
+                tag = tag[part]
+            elif isinstance(tag, TagList):
+                try:
+                    tag = tag.val[int(part)]
+                except (ValueError, IndexError):
+                    raise KeyError(path)
+            else:
+                raise KeyError(path)
+        return tag
 
     def __str__(self):
         s = f"Compound '{self.name}'"
@@ -267,28 +403,15 @@ class TagCompound(Tag):
 
 
 class TagIntArray(Tag):
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
-
     def read_payload(self, byte_handler: ByteHandler):
-        self.val = []
-        size = byte_handler.read_int()
-        for i in range(size):
-            tag = TagInt()
-            tag.read_payload(byte_handler)
-            self.val.append(tag)
+        size = byte_handler.read_length()
+        # Stored as a compact array of 32 bit ints rather than TagInts
+        self.val = byte_handler.read_array('i', size)
 
-    def get_payload_bytes(self):
-        b = b''
-        # Write the int size of the int array
-        b += struct.pack(">i", len(self.val))
-        # Write size ints
-        for i in self.val:
-            # b += struct.pack(">i", i)
-            b += i.get_payload_bytes()
-        return b
+    def write_payload(self, sink: bytearray):
+        # Write the int size of the int array followed by the ints
+        sink += _INT.pack(len(self.val))
+        sink += array_to_bytes('i', self.val)
 
     def __str__(self):
         s = f"Int Array '{self.name}': {self.val}"
@@ -296,58 +419,139 @@ class TagIntArray(Tag):
 
 
 class TagLongArray(Tag):
-    def read(self, byte_handler: ByteHandler):        
-        self.tag_type = byte_handler.read_byte()
-        self.read_header(byte_handler)
-        self.read_payload(byte_handler)
-
     def read_payload(self, byte_handler: ByteHandler):
-        self.val = []
-        size = byte_handler.read_int()
-        for i in range(size):
-            tag = TagLong()
-            tag.read_payload()
-            self.val.append(tag)
+        size = byte_handler.read_length()
+        # Stored as a compact array of 64 bit ints rather than TagLongs
+        self.val = byte_handler.read_array('q', size)
 
-    def get_payload_bytes(self):
-        b = b''
-        # Write the int size of the long array
-        b += struct.pack(">i", len(self.val))
-        # Write size longs
-        for l in self.val:
-            # b += struct.pack(">l", l)
-            b += l.get_payload_bytes()  
-        return b
+    def write_payload(self, sink: bytearray):
+        # Write the int size of the long array followed by the longs
+        sink += _INT.pack(len(self.val))
+        sink += array_to_bytes('q', self.val)
 
     def __str__(self):
         s = f"Long Array '{self.name}': {self.val}"
         return s 
 
 
+# Tag classes indexed by their type id
+TAG_TYPES = (
+    TagEnd,
+    TagByte,
+    TagShort,
+    TagInt,
+    TagLong,
+    TagFloat,
+    TagDouble,
+    TagByteArray,
+    TagString,
+    TagList,
+    TagCompound,
+    TagIntArray,
+    TagLongArray,
+)
+
+
+if _nbtcodec is not None:
+    _nbtcodec.init(TAG_TYPES, decode_mutf8, encode_mutf8, array_to_bytes,
+                   INTERN_MAX_SIZE, INTERN_MAX_ENTRIES)
+
+
 def id_to_tag(id):
-    if id == 0:
-        return TagEnd
-    elif id == 1:
-        return TagByte
-    elif id == 2:
-        return TagShort 
-    elif id == 3:
-        return TagInt
-    elif id == 4:
-        return TagLong 
-    elif id == 5:
-        return TagFloat  
-    elif id == 6:
-        return TagDouble 
-    elif id == 7:
-        return TagByteArray
-    elif id == 8:
-        return TagString 
-    elif id == 9:
-        return TagList
-    elif id == 10:
-        return TagCompound
-    elif id == 11:
-        return TagIntArray
-    elif id == 12:
-        return TagLongArray
+    try:
+        return TAG_TYPES[id]
+    except IndexError:
+        raise ValueError(f"Unknown tag type {id}")
+
+
+# Payload sizes of the tags that always take the same number of bytes
+FIXED_PAYLOAD_SIZES = {1: 1, 2: 2, 3: 4, 4: 8, 5: 4, 6: 8}
+# Item sizes of the array tags
+ARRAY_ITEM_SIZES = {7: 1, 11: 4, 12: 8}
+
+
+def skip_payload(byte_handler: ByteHandler, tag_type: int):
+    # Moves past a payload using only the length fields, without creating
+    # any tag objects
+    if tag_type in FIXED_PAYLOAD_SIZES:
+        byte_handler.seek(FIXED_PAYLOAD_SIZES[tag_type])
+    elif tag_type in ARRAY_ITEM_SIZES:
+        size = byte_handler.read_length()
+        byte_handler.seek(size * ARRAY_ITEM_SIZES[tag_type])
+    elif tag_type == 8:
+        byte_handler.seek(byte_handler.read_ushort())
+    elif tag_type == 9:
+        sub_tag_type = byte_handler.read_byte()
+        list_size = byte_handler.read_length()
+        depth = byte_handler.depth
+        if list_size and depth >= MAX_DEPTH:
+            raise ValueError("NBT data is nested too deeply")
+        if sub_tag_type in FIXED_PAYLOAD_SIZES:
+            byte_handler.seek(list_size * FIXED_PAYLOAD_SIZES[sub_tag_type])
+        else:
+            byte_handler.depth = depth + 1
+            for i in range(list_size):
+                skip_payload(byte_handler, sub_tag_type)
+            byte_handler.depth = depth
+    elif tag_type == 10:
+        depth = byte_handler.depth
+        byte_handler.depth = depth + 1
+        while True:
+            tagid = byte_handler.read_byte()
+            if tagid == 0:
+                break
+            if depth >= MAX_DEPTH:
+                raise ValueError("NBT data is nested too deeply")
+            byte_handler.seek(byte_handler.read_ushort())
+            skip_payload(byte_handler, tagid)
+        byte_handler.depth = depth
+    elif tag_type != 0:
+        # Skipping nothing would misread everything after it
+        raise ValueError(f"Unknown tag type {tag_type}")
+
+
+def read_tag(byte_handler: ByteHandler, lazy=False) -> Tag:
+    # Reads a complete named tag, such as the root compound of a file. With
+    # lazy set, nested lists and compounds are only decoded when accessed.
+    if use_native and not lazy:
+        tag, byte_handler.cur_byte = _nbtcodec.read_tag(
+            byte_handler.view, byte_handler.cur_byte)
+        return tag
+    start = byte_handler.cur_byte
+    tagid = byte_handler.read_byte()
+    tag = id_to_tag(tagid)()
+    tag.tag_type = tagid
+    tag.read_header(byte_handler)
+    if isinstance(tag, LazyTag):
+        tag.offset = start
+        tag.read_payload(byte_handler, lazy=lazy)
+    else:
+        tag.read_payload(byte_handler)
+    return tag
+
+
+def first_difference(a, b):
+    # Offset of the first byte where a and b differ, or None if they are
+    # equal. Compares a block at a time so long equal runs stay fast.
+    if a == b:
+        return None
+    block = 1 << 16
+    for start in range(0, min(len(a), len(b)), block):
+        if a[start:start + block] != b[start:start + block]:
+            for i in range(start, min(start + block, len(a), len(b))):
+                if a[i] != b[i]:
+                    return i
+    # One is a prefix of the other
+    return min(len(a), len(b))
+
+
+def round_trip_mismatch(data) -> int:
+    # Fully parses the named tag at the start of data, writes it out again
+    # and compares the result with the original bytes. Returns the offset
+    # of the first byte that differs, or None when the tag is reproduced
+    # exactly. Anything after the tag is ignored.
+    byte_handler = ByteHandler(data)
+    tag = read_tag(byte_handler)
+    sink = bytearray()
+    tag.write(sink)
+    return first_difference(byte_handler.view[:byte_handler.cur_byte], sink)
@@ -0,0 +1,855 @@
+/*
+ * Optional C implementation of the eager NBT parser and the serializer in
+ * Tags.py. It builds and writes the same Tag objects as the pure Python
+ * code, and Tags.py uses it automatically when it has been built:
+ *   python build_native.py
+ * Lazy reading stays in Python, it only touches a few tags anyway.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <string.h>
+
+#define NUM_TAG_TYPES 13
+/* Deeper nesting than Minecraft itself accepts is treated as corrupt, the
+ * same as MAX_DEPTH in Tags.py */
+#define MAX_DEPTH 512
+
+/* Set by init() from Tags.py. interned maps short names and item ids to
+ * one shared copy, like ByteHandler's table but keyed by the decoded str. */
+static PyObject *tag_types[NUM_TAG_TYPES];
+static PyObject *decode_mutf8;
+static PyObject *encode_mutf8;
+static PyObject *array_to_bytes;
+static PyObject *interned;
+static Py_ssize_t intern_max_size;
+static Py_ssize_t intern_max_entries;
+
+static PyObject *array_type;
+static PyObject *struct_error;
+static PyObject *empty_tuple;
+static PyObject *tag_type_ids[NUM_TAG_TYPES];
+static PyObject *typecodes[NUM_TAG_TYPES];
+
+static PyObject *str_tag_type;
+static PyObject *str_name;
+static PyObject *str_val;
+static PyObject *str_lazy_val;
+static PyObject *str_sub_tag_type;
+static PyObject *str_deferred;
+static PyObject *str_offset;
+
+static int is_little_endian(void)
+{
+    const unsigned short one = 1;
+    return *(const unsigned char *)&one == 1;
+}
+
+static void swap_items(unsigned char *p, Py_ssize_t len, int itemsize)
+{
+    /* Reverses the bytes of each item in place, written with shifts so
+     * compilers turn it into byte swap instructions */
+    if (itemsize == 4) {
+        for (Py_ssize_t i = 0; i < len; i += 4) {
+            uint32_t v;
+            memcpy(&v, p + i, 4);
+            v = (v >> 24) | ((v >> 8) & 0xFF00) | ((v << 8) & 0xFF0000) | (v << 24);
+            memcpy(p + i, &v, 4);
+        }
+    }
+    else if (itemsize == 8) {
+        for (Py_ssize_t i = 0; i < len; i += 8) {
+            uint64_t v;
+            memcpy(&v, p + i, 8);
+            v = ((v & 0x00000000000000FFULL) << 56) | ((v & 0x000000000000FF00ULL) << 40)
+              | ((v & 0x0000000000FF0000ULL) << 24) | ((v & 0x00000000FF000000ULL) << 8)
+              | ((v & 0x000000FF00000000ULL) >> 8) | ((v & 0x0000FF0000000000ULL) >> 24)
+              | ((v & 0x00FF000000000000ULL) >> 40) | ((v & 0xFF00000000000000ULL) >> 56);
+            memcpy(p + i, &v, 8);
+        }
+    }
+}
+
+static int is_lazy(int type)
+{
+    return type == 9 || type == 10;
+}
+
+/* Reading */
+
+typedef struct {
+    const unsigned char *buf;
+    Py_ssize_t len;
+    Py_ssize_t pos;
+} Reader;
+
+static int need(Reader *r, Py_ssize_t n)
+{
+    if (n < 0 || r->len - r->pos < n) {
+        PyErr_Format(PyExc_ValueError,
+                     "NBT data ends early, needed %zd bytes at byte %zd",
+                     n, r->pos);
+        return -1;
+    }
+    return 0;
+}
+
+static unsigned long long read_be(Reader *r, int size)
+{
+    unsigned long long v = 0;
+    for (int i = 0; i < size; i++)
+        v = (v << 8) | r->buf[r->pos + i];
+    r->pos += size;
+    return v;
+}
+
+static PyObject *read_number(Reader *r, int type)
+{
+    /* Value of the fixed size scalar tag types 1 to 6 */
+    const unsigned char *p = r->buf + r->pos;
+    double d;
+    switch (type) {
+    case 1:
+        if (need(r, 1) < 0) return NULL;
+        return PyLong_FromLong((signed char)read_be(r, 1));
+    case 2:
+        if (need(r, 2) < 0) return NULL;
+        return PyLong_FromLong((short)read_be(r, 2));
+    case 3:
+        if (need(r, 4) < 0) return NULL;
+        return PyLong_FromLong((int)(unsigned int)read_be(r, 4));
+    case 4:
+        if (need(r, 8) < 0) return NULL;
+        return PyLong_FromLongLong((long long)read_be(r, 8));
+    case 5:
+        if (need(r, 4) < 0) return NULL;
+        d = PyFloat_Unpack4((const char *)p, 0);
+        r->pos += 4;
+        break;
+    default:
+        if (need(r, 8) < 0) return NULL;
+        d = PyFloat_Unpack8((const char *)p, 0);
+        r->pos += 8;
+        break;
+    }
+    if (d == -1.0 && PyErr_Occurred())
+        return NULL;
+    return PyFloat_FromDouble(d);
+}
+
+static PyObject *read_str(Reader *r, int intern)
+{
+    Py_ssize_t size;
+    PyObject *s, *existing;
+
+    if (need(r, 2) < 0) return NULL;
+    size = (Py_ssize_t)read_be(r, 2);
+    if (need(r, size) < 0) return NULL;
+    s = PyUnicode_DecodeUTF8((const char *)r->buf + r->pos, size, NULL);
+    if (s == NULL) {
+        /* Not plain UTF-8, let ByteHandler decode the modified UTF-8 */
+        PyObject *raw;
+        if (!PyErr_ExceptionMatches(PyExc_UnicodeDecodeError))
+            return NULL;
+        PyErr_Clear();
+        raw = PyBytes_FromStringAndSize((const char *)r->buf + r->pos, size);
+        if (raw == NULL) return NULL;
+        s = PyObject_CallOneArg(decode_mutf8, raw);
+        Py_DECREF(raw);
+        if (s == NULL) return NULL;
+    }
+    r->pos += size;
+
+    /* Names and ids repeat, so short ones are shared like ByteHandler does.
+     * Other string values are mostly unique and would only fill the table. */
+    if (!intern || size > intern_max_size)
+        return s;
+    existing = PyDict_GetItemWithError(interned, s);
+    if (existing != NULL) {
+        Py_INCREF(existing);
+        Py_DECREF(s);
+        return existing;
+    }
+    if (PyErr_Occurred()) {
+        Py_DECREF(s);
+        return NULL;
+    }
+    if (PyDict_GET_SIZE(interned) < intern_max_entries) {
+        PyUnicode_InternInPlace(&s);
+        if (PyDict_SetItem(interned, s, s) < 0) {
+            Py_DECREF(s);
+            return NULL;
+        }
+    }
+    return s;
+}
+
+static PyObject *read_array(Reader *r, int type)
+{
+    /* Byte, int and long arrays become array.array like read_array */
+    int itemsize = type == 7 ? 1 : type == 11 ? 4 : 8;
+    long long count;
+    Py_ssize_t nbytes;
+    PyObject *raw, *arr;
+
+    if (need(r, 4) < 0) return NULL;
+    count = (int)(unsigned int)read_be(r, 4);
+    if (count < 0) {
+        PyErr_Format(PyExc_ValueError, "Negative array length at byte %zd",
+                     r->pos - 4);
+        return NULL;
+    }
+    nbytes = (Py_ssize_t)(count * itemsize);
+    if (need(r, nbytes) < 0) return NULL;
+    raw = PyBytes_FromStringAndSize((const char *)r->buf + r->pos, nbytes);
+    if (raw == NULL) return NULL;
+    if (is_little_endian())
+        swap_items((unsigned char *)PyBytes_AS_STRING(raw), nbytes, itemsize);
+    r->pos += nbytes;
+    arr = PyObject_CallFunctionObjArgs(array_type, typecodes[type], raw, NULL);
+    Py_DECREF(raw);
+    return arr;
+}
+
+static PyObject *new_tag(int type, PyObject *name, PyObject *val)
+{
+    /* A Tag with the same attributes Tag.__init__ and read_payload give
+     * it. Steals the reference to val. */
+    PyTypeObject *cls = (PyTypeObject *)tag_types[type];
+    PyObject *tag;
+    int err;
+
+    tag = cls->tp_new(cls, empty_tuple, NULL);
+    if (tag == NULL) {
+        Py_XDECREF(val);
+        return NULL;
+    }
+    /* Set in the order Tag.__init__ does, so the instance keeps its
+     * compact attribute layout */
+    err = PyObject_GenericSetAttr(tag, str_tag_type, tag_type_ids[type]) < 0
+        || PyObject_GenericSetAttr(tag, str_name, name) < 0;
+    if (!err && is_lazy(type)) {
+        /* LazyTag.val is a property over _val */
+        err = PyObject_GenericSetAttr(tag, str_deferred, Py_None) < 0
+            || PyObject_GenericSetAttr(tag, str_lazy_val, val ? val : Py_None) < 0;
+    }
+    else if (!err) {
+        err = PyObject_GenericSetAttr(tag, str_val, val ? val : Py_None) < 0;
+    }
+    Py_XDECREF(val);
+    if (err) {
+        Py_DECREF(tag);
+        return NULL;
+    }
+    return tag;
+}
+
+static PyObject *read_tag_payload(Reader *r, int type, PyObject *name, int depth);
+
+static PyObject *read_list(Reader *r, PyObject *name, int depth)
+{
+    int sub_type;
+    long long count;
+    PyObject *items, *tag, *sub_id;
+
+    if (need(r, 5) < 0) return NULL;
+    sub_type = (int)read_be(r, 1);
+    count = (int)(unsigned int)read_be(r, 4);
+    if (sub_type >= NUM_TAG_TYPES) {
+        PyErr_Format(PyExc_ValueError, "Unknown tag type %d", sub_type);
+        return NULL;
+    }
+    if (count < 0) {
+        PyErr_Format(PyExc_ValueError, "Negative list length at byte %zd",
+                     r->pos - 4);
+        return NULL;
+    }
+    items = PyList_New(0);
+    if (items == NULL) return NULL;
+    for (long long i = 0; i < count; i++) {
+        tag = read_tag_payload(r, sub_type, Py_None, depth + 1);
+        if (tag == NULL || PyList_Append(items, tag) < 0) {
+            Py_XDECREF(tag);
+            Py_DECREF(items);
+            return NULL;
+        }
+        Py_DECREF(tag);
+    }
+
+    tag = new_tag(9, name, items);
+    if (tag == NULL) return NULL;
+    sub_id = tag_type_ids[sub_type];
+    if (PyObject_SetAttr(tag, str_sub_tag_type, sub_id) < 0) {
+        Py_DECREF(tag);
+        return NULL;
+    }
+    return tag;
+}
+
+static PyObject *read_compound(Reader *r, PyObject *name, int depth)
+{
+    int type;
+    PyObject *items, *child_name, *tag;
+
+    items = PyList_New(0);
+    if (items == NULL) return NULL;
+    while (1) {
+        if (need(r, 1) < 0) goto error;
+        type = (int)read_be(r, 1);
+        if (type == 0)
+            break;
+        if (type >= NUM_TAG_TYPES) {
+            PyErr_Format(PyExc_ValueError, "Unknown tag type %d", type);
+            goto error;
+        }
+        child_name = read_str(r, 1);
+        if (child_name == NULL) goto error;
+        tag = read_tag_payload(r, type, child_name, depth + 1);
+        Py_DECREF(child_name);
+        if (tag == NULL || PyList_Append(items, tag) < 0) {
+            Py_XDECREF(tag);
+            goto error;
+        }
+        Py_DECREF(tag);
+    }
+    return new_tag(10, name, items);
+
+error:
+    Py_DECREF(items);
+    return NULL;
+}
+
+static PyObject *read_tag_payload(Reader *r, int type, PyObject *name, int depth)
+{
+    PyObject *val;
+
+    if (depth > MAX_DEPTH) {
+        PyErr_SetString(PyExc_ValueError, "NBT data is nested too deeply");
+        return NULL;
+    }
+    switch (type) {
+    case 0:
+        return new_tag(0, name, NULL);
+    case 9:
+        return read_list(r, name, depth);
+    case 10:
+        return read_compound(r, name, depth);
+    case 7: case 11: case 12:
+        val = read_array(r, type);
+        break;
+    case 8:
+        /* Item ids are interned like names, list items have no name */
+        val = read_str(r, PyUnicode_Check(name)
+                       && PyUnicode_CompareWithASCIIString(name, "id") == 0);
+        break;
+    default:
+        val = read_number(r, type);
+        break;
+    }
+    if (val == NULL)
+        return NULL;
+    return new_tag(type, name, val);
+}
+
+static PyObject *codec_read_tag(PyObject *self, PyObject *args)
+{
+    /* read_tag(buffer, offset) -> (tag, end): reads the complete named
+     * tag at offset, returning it and the offset just past it */
+    Py_buffer view;
+    Py_ssize_t offset;
+    Reader r;
+    int type;
+    PyObject *name = NULL, *tag = NULL, *result = NULL, *start = NULL;
+
+    if (!PyArg_ParseTuple(args, "y*n", &view, &offset))
+        return NULL;
+    r.buf = view.buf;
+    r.len = view.len;
+    r.pos = offset;
+    if (offset < 0 || offset > view.len) {
+        PyErr_SetString(PyExc_ValueError, "offset is outside the buffer");
+        goto done;
+    }
+    if (need(&r, 1) < 0) goto done;
+    type = (int)read_be(&r, 1);
+    if (type >= NUM_TAG_TYPES) {
+        PyErr_Format(PyExc_ValueError, "Unknown tag type %d", type);
+        goto done;
+    }
+    /* Like Tag.read_header, a root TagEnd has a name too */
+    name = read_str(&r, 1);
+    if (name == NULL) goto done;
+    tag = read_tag_payload(&r, type, name, 0);
+    if (tag == NULL) goto done;
+    if (is_lazy(type)) {
+        /* read_tag records where a root container starts */
+        start = PyLong_FromSsize_t(offset);
+        if (start == NULL || PyObject_SetAttr(tag, str_offset, start) < 0)
+            goto done;
+    }
+    result = Py_BuildValue("On", tag, r.pos);
+
+done:
+    Py_XDECREF(start);
+    Py_XDECREF(tag);
+    Py_XDECREF(name);
+    PyBuffer_Release(&view);
+    return result;
+}
+
+/* Writing */
+
+/* Writes straight into the sink bytearray, which is grown ahead of len
+ * and cut back to it when done */
+typedef struct {
+    PyObject *sink;
+    Py_ssize_t start;
+    Py_ssize_t len;
+    Py_ssize_t cap;
+} Writer;
+
+static int start_writer(Writer *w, PyObject *sink)
+{
+    w->sink = sink;
+    w->start = w->len = w->cap = PyByteArray_GET_SIZE(sink);
+    return 0;
+}
+
+static char *reserve(Writer *w, Py_ssize_t n)
+{
+    if (w->cap - w->len < n) {
+        Py_ssize_t cap = w->cap - w->start < 256 ? w->start + 256 : w->cap;
+        while (cap - w->len < n)
+            cap = w->start + (cap - w->start) * 2;
+        if (PyByteArray_Resize(w->sink, cap) < 0)
+            return NULL;
+        w->cap = cap;
+    }
+    w->len += n;
+    return PyByteArray_AS_STRING(w->sink) + w->len - n;
+}
+
+static int write_be(Writer *w, unsigned long long v, int size)
+{
+    char *p = reserve(w, size);
+    if (p == NULL) return -1;
+    for (int i = size - 1; i >= 0; i--) {
+        p[i] = (char)(v & 0xFF);
+        v >>= 8;
+    }
+    return 0;
+}
+
+static int write_raw(Writer *w, const char *data, Py_ssize_t n)
+{
+    char *p = reserve(w, n);
+    if (p == NULL) return -1;
+    memcpy(p, data, n);
+    return 0;
+}
+
+static int tag_class_id(PyObject *tag)
+{
+    /* Which tag class tag is, which decides how its payload is written */
+    PyObject *cls = (PyObject *)Py_TYPE(tag);
+    for (int i = 0; i < NUM_TAG_TYPES; i++) {
+        if (cls == tag_types[i])
+            return i;
+    }
+    for (int i = 0; i < NUM_TAG_TYPES; i++) {
+        int match = PyObject_IsInstance(tag, tag_types[i]);
+        if (match < 0) return -1;
+        if (match) return i;
+    }
+    PyErr_Format(PyExc_TypeError, "%R is not a Tag", tag);
+    return -1;
+}
+
+static int get_int(PyObject *obj, long long min, long long max,
+                   const char *format, long long *out)
+{
+    /* Range checked like struct.pack, raising struct.error */
+    PyObject *index = PyNumber_Index(obj);
+    int overflow;
+    long long v;
+
+    if (index == NULL) {
+        PyErr_SetString(struct_error, "required argument is not an integer");
+        return -1;
+    }
+    v = PyLong_AsLongLongAndOverflow(index, &overflow);
+    Py_DECREF(index);
+    if (v == -1 && PyErr_Occurred())
+        return -1;
+    if (overflow || v < min || v > max) {
+        PyErr_Format(struct_error, "'%s' format requires %lld <= number <= %lld",
+                     format, min, max);
+        return -1;
+    }
+    *out = v;
+    return 0;
+}
+
+static int write_str(Writer *w, PyObject *s)
+{
+    /* Unsigned short length and the modified UTF-8 bytes */
+    const char *data;
+    Py_ssize_t size;
+    PyObject *encoded = NULL;
+    int err;
+
+    if (!PyUnicode_Check(s)) {
+        PyErr_Format(PyExc_TypeError, "expected a str, not %R", s);
+        return -1;
+    }
+    if (PyUnicode_IS_ASCII(s)
+            && memchr(PyUnicode_DATA(s), 0, PyUnicode_GET_LENGTH(s)) == NULL) {
+        data = (const char *)PyUnicode_DATA(s);
+        size = PyUnicode_GET_LENGTH(s);
+    }
+    else {
+        encoded = PyObject_CallOneArg(encode_mutf8, s);
+        if (encoded == NULL) return -1;
+        if (PyBytes_AsStringAndSize(encoded, (char **)&data, &size) < 0) {
+            Py_DECREF(encoded);
+            return -1;
+        }
+    }
+    if (size > 0xFFFF) {
+        PyErr_SetString(struct_error,
+                        "'H' format requires 0 <= number <= 65535");
+        Py_XDECREF(encoded);
+        return -1;
+    }
+    err = write_be(w, (unsigned long long)size, 2) < 0
+        || write_raw(w, data, size) < 0;
+    Py_XDECREF(encoded);
+    return err ? -1 : 0;
+}
+
+static int write_array(Writer *w, PyObject *val, int type)
+{
+    /* Writes an array.array of the tag's own typecode directly. Returns 1
+     * when written, 0 if val is something else and -1 on errors. */
+    const char *code = PyUnicode_AsUTF8(typecodes[type]);
+    Py_buffer buffer;
+    char *p;
+    int itemsize = type == 7 ? 1 : type == 11 ? 4 : 8;
+
+    if (!PyObject_TypeCheck(val, (PyTypeObject *)array_type))
+        return 0;
+    if (PyObject_GetBuffer(val, &buffer, PyBUF_FORMAT) < 0)
+        return -1;
+    if (buffer.itemsize != itemsize || buffer.format == NULL
+            || strcmp(buffer.format, code) != 0
+            || buffer.len / itemsize > INT_MAX) {
+        PyBuffer_Release(&buffer);
+        return 0;
+    }
+    if (write_be(w, (unsigned long long)(buffer.len / itemsize), 4) < 0
+            || (p = reserve(w, buffer.len)) == NULL) {
+        PyBuffer_Release(&buffer);
+        return -1;
+    }
+    memcpy(p, buffer.buf, buffer.len);
+    if (is_little_endian())
+        swap_items((unsigned char *)p, buffer.len, itemsize);
+    PyBuffer_Release(&buffer);
+    return 1;
+}
+
+static int write_named(Writer *w, PyObject *tag, int depth);
+
+static int write_payload(Writer *w, PyObject *tag, int depth)
+{
+    int type = tag_class_id(tag);
+    PyObject *val = NULL, *items = NULL;
+    int err = -1;
+    long long v;
+    double d;
+
+    if (type < 0) return -1;
+    if (depth > MAX_DEPTH) {
+        PyErr_SetString(PyExc_ValueError, "Tag tree is nested too deeply");
+        return -1;
+    }
+
+    if (is_lazy(type)) {
+        /* A container that was never decoded is copied as it was read */
+        PyObject *deferred = PyObject_GetAttr(tag, str_deferred);
+        if (deferred == NULL) return -1;
+        if (deferred != Py_None) {
+            PyObject *view = NULL;
+            Py_ssize_t start, end;
+            Py_buffer buffer;
+            if (!PyArg_ParseTuple(deferred, "Onn", &view, &start, &end)) {
+                Py_DECREF(deferred);
+                return -1;
+            }
+            if (PyObject_GetBuffer(view, &buffer, PyBUF_SIMPLE) < 0) {
+                Py_DECREF(deferred);
+                return -1;
+            }
+            err = write_raw(w, (const char *)buffer.buf + start, end - start);
+            PyBuffer_Release(&buffer);
+            Py_DECREF(deferred);
+            return err;
+        }
+        Py_DECREF(deferred);
+        val = PyObject_GetAttr(tag, str_lazy_val);
+    }
+    else if (type != 0) {
+        val = PyObject_GetAttr(tag, str_val);
+    }
+    if (val == NULL && type != 0)
+        return -1;
+
+    switch (type) {
+    case 0:
+        err = 0;
+        break;
+    case 1:
+        err = get_int(val, -128, 127, "b", &v) < 0 || write_be(w, v, 1) < 0;
+        break;
+    case 2:
+        err = get_int(val, -32768, 32767, "h", &v) < 0 || write_be(w, v, 2) < 0;
+        break;
+    case 3:
+        err = get_int(val, INT_MIN, INT_MAX, "i", &v) < 0 || write_be(w, v, 4) < 0;
+        break;
+    case 4:
+        err = get_int(val, LLONG_MIN, LLONG_MAX, "q", &v) < 0
+            || write_be(w, v, 8) < 0;
+        break;
+    case 5:
+    case 6: {
+        int size = type == 5 ? 4 : 8;
+        char *p;
+        d = PyFloat_AsDouble(val);
+        if (d == -1.0 && PyErr_Occurred()) break;
+        p = reserve(w, size);
+        if (p == NULL) break;
+        err = (type == 5 ? PyFloat_Pack4(d, p, 0) : PyFloat_Pack8(d, p, 0)) < 0;
+        break;
+    }
+    case 7: case 11: case 12: {
+        /* Length, then the array converted by ByteHandler.array_to_bytes */
+        Py_ssize_t count;
+        PyObject *raw;
+        int fast = write_array(w, val, type);
+        if (fast < 0) break;
+        if (fast) {
+            err = 0;
+            break;
+        }
+        count = PyObject_Length(val);
+        if (count < 0) break;
+        raw = PyObject_CallFunctionObjArgs(array_to_bytes, typecodes[type],
+                                           val, NULL);
+        if (raw == NULL) break;
+        err = write_be(w, (unsigned long long)count, 4) < 0
+            || write_raw(w, PyBytes_AS_STRING(raw), PyBytes_GET_SIZE(raw)) < 0;
+        Py_DECREF(raw);
+        break;
+    }
+    case 8:
+        err = write_str(w, val);
+        break;
+    case 9: {
+        PyObject *sub = PyObject_GetAttr(tag, str_sub_tag_type);
+        Py_ssize_t n;
+        if (sub == NULL) break;
+        err = get_int(sub, 0, 255, "B", &v);
+        Py_DECREF(sub);
+        if (err) break;
+        err = -1;
+        items = PySequence_Fast(val, "TagList val must be a sequence");
+        if (items == NULL) break;
+        n = PySequence_Fast_GET_SIZE(items);
+        if (n > INT_MAX) {
+            PyErr_SetString(struct_error, "list is too long");
+            break;
+        }
+        if (write_be(w, v, 1) < 0 || write_be(w, (unsigned long long)n, 4) < 0)
+            break;
+        err = 0;
+        for (Py_ssize_t i = 0; i < n && !err; i++)
+            err = write_payload(w, PySequence_Fast_GET_ITEM(items, i), depth + 1);
+        break;
+    }
+    case 10: {
+        Py_ssize_t n;
+        items = PySequence_Fast(val, "TagCompound val must be a sequence");
+        if (items == NULL) break;
+        n = PySequence_Fast_GET_SIZE(items);
+        err = 0;
+        for (Py_ssize_t i = 0; i < n && !err; i++)
+            err = write_named(w, PySequence_Fast_GET_ITEM(items, i), depth + 1);
+        if (!err)
+            err = write_be(w, 0, 1);
+        break;
+    }
+    }
+    Py_XDECREF(items);
+    Py_XDECREF(val);
+    return err ? -1 : 0;
+}
+
+static int write_named(Writer *w, PyObject *tag, int depth)
+{
+    /* Tag.write: type byte, name, payload. TagEnd is just its type byte. */
+    PyObject *type_obj, *name;
+    long long type;
+    int class_id = tag_class_id(tag);
+    int err;
+
+    if (class_id < 0) return -1;
+    if (class_id == 0)
+        return write_be(w, 0, 1);
+    type_obj = PyObject_GetAttr(tag, str_tag_type);
+    if (type_obj == NULL) return -1;
+    err = get_int(type_obj, 0, 255, "B", &type);
+    Py_DECREF(type_obj);
+    if (err || write_be(w, type, 1) < 0) return -1;
+    name = PyObject_GetAttr(tag, str_name);
+    if (name == NULL) return -1;
+    err = write_str(w, name);
+    Py_DECREF(name);
+    if (err) return -1;
+    return write_payload(w, tag, depth);
+}
+
+static PyObject *finish(Writer *w, int err)
+{
+    /* Trims the sink to what was written, or back to where it started if
+     * writing failed */
+    PyObject *type, *value, *traceback;
+    if (!err) {
+        if (PyByteArray_Resize(w->sink, w->len) < 0)
+            return NULL;
+        Py_RETURN_NONE;
+    }
+    PyErr_Fetch(&type, &value, &traceback);
+    if (PyByteArray_Resize(w->sink, w->start) < 0)
+        PyErr_Clear();
+    PyErr_Restore(type, value, traceback);
+    return NULL;
+}
+
+static PyObject *codec_write(PyObject *self, PyObject *args)
+{
+    /* write(tag, sink): Tag.write(sink) for a whole tree */
+    PyObject *tag, *sink;
+    Writer w;
+
+    if (!PyArg_ParseTuple(args, "OO!", &tag, &PyByteArray_Type, &sink))
+        return NULL;
+    start_writer(&w, sink);
+    return finish(&w, write_named(&w, tag, 0));
+}
+
+static PyObject *codec_write_payload(PyObject *self, PyObject *args)
+{
+    /* write_payload(tag, sink): Tag.write_payload(sink) for a whole tree */
+    PyObject *tag, *sink;
+    Writer w;
+
+    if (!PyArg_ParseTuple(args, "OO!", &tag, &PyByteArray_Type, &sink))
+        return NULL;
+    start_writer(&w, sink);
+    return finish(&w, write_payload(&w, tag, 0));
+}
+
+static PyObject *codec_init(PyObject *self, PyObject *args)
+{
+    /* init(tag_types, decode_mutf8, encode_mutf8, array_to_bytes,
+     *      intern_max_size, intern_max_entries) */
+    PyObject *types, *decode, *encode, *to_bytes, *table;
+    Py_ssize_t max_size, max_entries;
+
+    if (!PyArg_ParseTuple(args, "O!OOOnn", &PyTuple_Type, &types, &decode,
+                          &encode, &to_bytes, &max_size, &max_entries))
+        return NULL;
+    if (PyTuple_GET_SIZE(types) != NUM_TAG_TYPES) {
+        PyErr_Format(PyExc_ValueError, "expected %d tag types", NUM_TAG_TYPES);
+        return NULL;
+    }
+    for (int i = 0; i < NUM_TAG_TYPES; i++) {
+        PyObject *cls = PyTuple_GET_ITEM(types, i);
+        if (!PyType_Check(cls)) {
+            PyErr_SetString(PyExc_TypeError, "tag types must be classes");
+            return NULL;
+        }
+        Py_XSETREF(tag_types[i], Py_NewRef(cls));
+    }
+    Py_XSETREF(decode_mutf8, Py_NewRef(decode));
+    Py_XSETREF(encode_mutf8, Py_NewRef(encode));
+    Py_XSETREF(array_to_bytes, Py_NewRef(to_bytes));
+    /* Decoded strings, shared between reads */
+    table = PyDict_New();
+    if (table == NULL) return NULL;
+    Py_XSETREF(interned, table);
+    intern_max_size = max_size;
+    intern_max_entries = max_entries;
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef codec_methods[] = {
+    {"init", codec_init, METH_VARARGS,
+     "Set the Tag classes and helpers from Tags.py."},
+    {"read_tag", codec_read_tag, METH_VARARGS,
+     "read_tag(buffer, offset) -> (tag, end)"},
+    {"write", codec_write, METH_VARARGS,
+     "write(tag, sink): append the named tag to the bytearray sink"},
+    {"write_payload", codec_write_payload, METH_VARARGS,
+     "write_payload(tag, sink): append the tag's payload to sink"},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef codec_module = {
+    PyModuleDef_HEAD_INIT, "_nbtcodec",
+    "C implementation of the NBT reader and writer in Tags.py.",
+    -1, codec_methods
+};
+
+PyMODINIT_FUNC PyInit__nbtcodec(void)
+{
+    PyObject *array_module, *struct_module;
+    static const char *codes[NUM_TAG_TYPES] = {
+        NULL, NULL, NULL, NULL, NULL, NULL, NULL, "b",
+        NULL, NULL, NULL, "i", "q"};
+
+    array_module = PyImport_ImportModule("array");
+    if (array_module == NULL) return NULL;
+    array_type = PyObject_GetAttrString(array_module, "array");
+    Py_DECREF(array_module);
+    if (array_type == NULL) return NULL;
+
+    struct_module = PyImport_ImportModule("struct");
+    if (struct_module == NULL) return NULL;
+    struct_error = PyObject_GetAttrString(struct_module, "error");
+    Py_DECREF(struct_module);
+    if (struct_error == NULL) return NULL;
+
+    empty_tuple = PyTuple_New(0);
+    if (empty_tuple == NULL) return NULL;
+    for (int i = 0; i < NUM_TAG_TYPES; i++) {
+        tag_type_ids[i] = PyLong_FromLong(i);
+        if (tag_type_ids[i] == NULL) return NULL;
+        if (codes[i] != NULL) {
+            typecodes[i] = PyUnicode_InternFromString(codes[i]);
+            if (typecodes[i] == NULL) return NULL;
+        }
+    }
+
+    if (!(str_tag_type = PyUnicode_InternFromString("tag_type"))
+            || !(str_name = PyUnicode_InternFromString("name"))
+            || !(str_val = PyUnicode_InternFromString("val"))
+            || !(str_lazy_val = PyUnicode_InternFromString("_val"))
+            || !(str_sub_tag_type = PyUnicode_InternFromString("sub_tag_type"))
+            || !(str_deferred = PyUnicode_InternFromString("deferred"))
+            || !(str_offset = PyUnicode_InternFromString("offset")))
+        return NULL;
+
+    return PyModule_Create(&codec_module);
+}
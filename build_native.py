@@ -0,0 +1,33 @@
+# Builds the optional _nbtcodec C extension next to Tags.py, which then
+# picks it up automatically. Needs a C compiler, the Python headers and
+# setuptools. Without the extension everything runs in pure Python.
+# Run from the repository root: python build_native.py
+import sys
+import tempfile
+from pathlib import Path
+
+from setuptools import Distribution, Extension
+from setuptools.command.build_ext import build_ext
+
+ROOT = Path(__file__).resolve().parent
+
+
+def main():
+    if sys.version_info < (3, 11):
+        # PyFloat_Pack4/Unpack4 became public API in 3.11
+        print("The C codec needs Python 3.11 or newer", file=sys.stderr)
+        return 1
+    extension = Extension('_nbtcodec', [str(ROOT / '_nbtcodec.c')],
+                          extra_compile_args=['-O2'] if sys.platform != 'win32' else [])
+    command = build_ext(Distribution({'ext_modules': [extension]}))
+    with tempfile.TemporaryDirectory() as build_temp:
+        command.build_temp = build_temp
+        command.build_lib = str(ROOT)
+        command.ensure_finalized()
+        command.run()
+    print(f"Built {command.get_ext_fullpath('_nbtcodec')}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+import argparse
+import sys
+from pathlib import Path
+
+from InventoryHandler import InventoryHandler, FAST_COMPRESSION, MAX_COMPRESSION
+import Profiler
+
+
+def batch_command(args):
+    # Imported here so the other commands don't pay for the process pool
+    from BatchEditor import load_rules, run_batch
+
+    rules = load_rules(args.rules)
+    failed = run_batch(
+        args.directory,
+        rules,
+        output_dir=args.output,
+        workers=args.workers,
+        compresslevel=FAST_COMPRESSION if args.fast else MAX_COMPRESSION,
+    )
+    return 1 if failed else 0
+
+
+def show_command(args):
+    for save_file in args.files:
+        handler = InventoryHandler(save_file)
+        print(f"{save_file}:")
+        for item in handler.get_items():
+            print(f"  {item}")
+    return 0
+
+
+def index_command(args):
+    from ItemIndex import ItemIndex
+
+    with ItemIndex(args.db) as index:
+        updated, removed, failed = index.update(args.directory)
+    for save_file, error in failed:
+        print(f"{save_file.name}: error: {error}")
+    print(f"{updated} files indexed, {removed} removed, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+def query_command(args):
+    from ItemIndex import ItemIndex
+
+    with ItemIndex(args.db) as index:
+        if args.totals:
+            for path, total in index.totals(args.item_id):
+                print(f"{path}\t{total}")
+        else:
+            for path, slot, count in index.query(args.item_id):
+                print(f"{path}\tslot {slot}\t{count}")
+    return 0
+
+
+def containers_command(args):
+    from RegionFile import iter_container_items
+
+    region_files = []
+    for path in args.paths:
+        if path.is_dir():
+            region_files.extend(sorted(path.glob('*.mca')))
+        else:
+            region_files.append(path)
+
+    errors = []
+    found = 0
+    for container_id, x, y, z, item in iter_container_items(
+            region_files, workers=args.workers, errors=errors):
+        if args.id is not None and item.id != args.id:
+            continue
+        found += 1
+        print(f"{x} {y} {z}\t{container_id}\tslot {item.slot}\t"
+              f"{item.count}\t{item.id}")
+    for path, index, error in errors:
+        print(f"{path} chunk {index}: error: {error}", file=sys.stderr)
+    print(f"{found} items in {len(region_files)} region files, "
+          f"{len(errors)} chunks failed", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def verify_command(args):
+    from concurrent.futures import ProcessPoolExecutor
+    from InventoryHandler import verify_file
+
+    save_files = []
+    for path in args.paths:
+        if path.is_dir():
+            save_files.extend(sorted(path.rglob('*.dat')))
+        else:
+            save_files.append(path)
+
+    if args.workers == 0:
+        results = map(verify_file, save_files)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=args.workers)
+        results = executor.map(verify_file, save_files, chunksize=16)
+
+    failed = 0
+    try:
+        for save_file, offset, error in results:
+            if error is not None:
+                print(f"{save_file}: error: {error}")
+            elif offset is not None:
+                print(f"{save_file}: differs at byte {offset}")
+            else:
+                continue
+            failed += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    print(f"{len(save_files)} files checked, {failed} don't round-trip",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='cli.py',
+        description="Headless tools for editing Minecraft inventory files.")
+    parser.add_argument('--profile', action='store_true',
+                        help="print time spent per phase, tag type and read "
+                             "to stderr (work in worker processes isn't "
+                             "included, use -j 0 with batch)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    show = commands.add_parser('show', help="print the items in player files")
+    show.add_argument('files', type=Path, nargs='+', help="player .dat files")
+    show.set_defaults(func=show_command)
+
+    batch = commands.add_parser(
+        'batch',
+        help="apply a rules file to every player file in a directory")
+    batch.add_argument('rules', type=Path, help="JSON rules file")
+    batch.add_argument('directory', type=Path,
+                       help="directory of player .dat files, e.g. playerdata/")
+    batch.add_argument('-o', '--output', type=Path, default=None,
+                       help="write edited files here instead of in place")
+    batch.add_argument('-j', '--workers', type=int, default=None,
+                       help="number of worker processes (default: CPU count, "
+                            "0 runs in this process)")
+    batch.add_argument('--fast', action='store_true',
+                       help="use fast rather than maximum gzip compression")
+    batch.set_defaults(func=batch_command)
+
+    index = commands.add_parser(
+        'index', help="add a directory of player files to the item index")
+    index.add_argument('directory', type=Path,
+                       help="directory of player .dat files, e.g. playerdata/")
+    index.add_argument('--db', type=Path, default=Path('items.db'),
+                       help="index database (default: items.db)")
+    index.set_defaults(func=index_command)
+
+    query = commands.add_parser(
+        'query', help="list the players holding an item, from the index")
+    query.add_argument('item_id', help="item id, e.g. minecraft:diamond")
+    query.add_argument('--db', type=Path, default=Path('items.db'),
+                       help="index database (default: items.db)")
+    query.add_argument('--totals', action='store_true',
+                       help="show the total count per player file instead")
+    query.set_defaults(func=query_command)
+
+    containers = commands.add_parser(
+        'containers', help="list the items in containers in region files")
+    containers.add_argument('paths', type=Path, nargs='+',
+                            help="region .mca files or region/ directories")
+    containers.add_argument('--id', default=None,
+                            help="only show this item id")
+    containers.add_argument('-j', '--workers', type=int, default=None,
+                            help="number of worker processes (default: CPU count)")
+    containers.set_defaults(func=containers_command)
+
+    verify = commands.add_parser(
+        'verify',
+        help="check that files are written back byte for byte when parsed")
+    verify.add_argument('paths', type=Path, nargs='+',
+                        help=".dat files or directories to search for them, "
+                             "e.g. a whole world")
+    verify.add_argument('-j', '--workers', type=int, default=None,
+                        help="number of worker processes (default: CPU count, "
+                             "0 runs in this process)")
+    verify.set_defaults(func=verify_command)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        Profiler.enable()
+    try:
+        return args.func(args)
+    finally:
+        if args.profile:
+            print(Profiler.stats.report(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,41 +1,55 @@
 import tkinter as tk
-from tkinter.filedialog import askopenfilename
+from tkinter.filedialog import askopenfilename, askdirectory
+from tkinter import ttk
 from tkinter.constants import DISABLED, BOTH
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List
+import base64
+import sys
 
 from Item import Item
-from InventoryHandler import InventoryHandler
+from ParseCache import ParseCache
+import Profiler
+import SpritePack
 
 
 class ItemSpriteHandler:
+    # Uses the prebuilt sprite pack when there is one (python SpritePack.py),
+    # which only decodes the sprites that are shown. Without it the whole
+    # sprite sheet is loaded and cut up on first use of each sprite.
     def __init__(self):
-        self.spritesheet = tk.PhotoImage(file="items-28.png")
+        self.pack = None
+        if Path(SpritePack.PACK_FILE).is_file():
+            try:
+                self.pack = SpritePack.SpritePack(SpritePack.PACK_FILE)
+            except ValueError as e:
+                print(f"Ignoring the sprite pack: {e}")
+        if self.pack is not None and self.pack.is_stale():
+            print("Ignoring the sprite pack: the sprite sheet or id csv changed "
+                  "since it was built, rebuild it with python SpritePack.py")
+            self.pack.close()
+            self.pack = None
 
         self.sprite_width = 32
         self.sprite_height = 32
         self.spritesheet_width = 27
         self.spritesheet_height = 27
 
+        if self.pack is not None:
+            # One image per sprite in the pack, loaded on first use
+            self.images = [None] * len(self.pack.sprites)
+            self.mcid_to_index = self.pack.sprite_of_id
+            return
+
+        self.spritesheet = tk.PhotoImage(file=SpritePack.SHEET_FILE)
+
         # Load images
-        self.images = []
-        for row in range(self.spritesheet_height):
-            for col in range(self.spritesheet_width):
-                self.images.append(None)
-                # l = col * self.sprite_width
-                # t = row * self.sprite_height
-                # self.images.append(
-                # self.subimage(
-                # l, t, l + self.sprite_width, t + self.sprite_height
-                # )
-                # )
+        self.images = [None] * (self.spritesheet_width * self.spritesheet_height)
 
         # Load the dictionary that will map from the minecraft id string to
         # the index in the images list
-        self.mcid_to_index = {}
-        file = open('Scraping/mcid_to_index.csv', 'r')
-        for line in file:
-            mcid, raw_index = line.split(',')
-            self.mcid_to_index[mcid] = int(raw_index)
+        self.mcid_to_index = SpritePack.load_index(SpritePack.INDEX_FILE)
 
     def subimage(self, l, t, r, b):
         new_image = tk.PhotoImage()
@@ -50,23 +64,25 @@ class ItemSpriteHandler:
         )
         return new_image
 
-    # def get_image(self, minecraft_id: str) -> tk.PhotoImage:
-        # return self.images[self.mcid_to_index[minecraft_id]]
+    def load_image(self, index: int) -> tk.PhotoImage:
+        if self.pack is not None:
+            png = base64.b64encode(self.pack.sprite_png(index))
+            return tk.PhotoImage(data=png, format='png')
+        row = index // self.spritesheet_height
+        col = index % self.spritesheet_width
+        l = col * self.sprite_width
+        t = row * self.sprite_height
+        return self.subimage(l, t, l + self.sprite_width, t + self.sprite_height)
 
     def get_image(self, minecraft_id: str) -> tk.PhotoImage:
-        img = self.images[self.mcid_to_index[minecraft_id]]
+        # None for ids that aren't in the sprite sheet
+        index = self.mcid_to_index.get(minecraft_id)
+        if index is None:
+            return None
+        img = self.images[index]
         if img is None:
-            index = self.mcid_to_index[minecraft_id]
-            row = index // self.spritesheet_height
-            col = index % self.spritesheet_width
-            l = col * self.sprite_width
-            t = row * self.sprite_height
-            self.images[index] = self.subimage(
-                l, t, l + self.sprite_width, t + self.sprite_height
-            )
-            return self.images[index]
-        else:
-            return img
+            img = self.images[index] = self.load_image(index)
+        return img
 
 
 class ModifyItemPopupWindow:
@@ -139,68 +155,145 @@ class ModifyItemPopupWindow:
         self.window.destroy()
 
 
-class ItemSlot(tk.Frame):
-    def __init__(self, master, row, column, slot_num):
+# Canvas position (column, row) of every slot shown in the grid
+SLOT_POSITIONS = {}
+# Armour, boots at the bottom
+for r in range(0, 4):
+    SLOT_POSITIONS[103 - r] = (0, r)
+# Shield
+SLOT_POSITIONS[-106] = (4, 3)
+# The 3 main inventory rows
+for r in range(0, 3):
+    for c in range(0, 9):
+        SLOT_POSITIONS[9 + r * 9 + c] = (c, 4 + r)
+# The equip row
+for c in range(0, 9):
+    SLOT_POSITIONS[c] = (c, 7)
+
+SLOT_SIZE = 64
+SLOT_PADDING = 5
+SLOT_PITCH = SLOT_SIZE + 2 * SLOT_PADDING
+SLOT_COLOUR = "#a6a6a6"
+
+# Player files either side of the selected one that are parsed ahead of
+# time in folder mode
+PREFETCH_COUNT = 3
+PARSE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class InventoryGrid(tk.Canvas):
+    # All of the slots drawn on one canvas. Every slot is a rectangle, an
+    # image and a count text item made once, and showing an item only
+    # reconfigures them. Changed slots are marked dirty and redrawn together
+    # once Tk is idle, and slots whose item looks the same are left alone,
+    # so loading another file only touches the slots that differ.
+    def __init__(self, master):
+        columns = 1 + max(c for c, r in SLOT_POSITIONS.values())
+        rows = 1 + max(r for c, r in SLOT_POSITIONS.values())
         super().__init__(master,
-                         # bg="#898c87",
-                         bg="#a6a6a6",
-                         width=64,
-                         height=64)
-        self.grid(column=column, row=row, padx=5, pady=5)
+                         width=columns * SLOT_PITCH,
+                         height=rows * SLOT_PITCH,
+                         highlightthickness=0)
         self.popup_window = None
 
-        # New item object that will store the item data associated with the
-        # slot
-        self.item = Item(slot=slot_num)
-
-        # Won't have any image by default
-        self.image_label = tk.Label(self, bg="#a6a6a6")
-        # self.image_label.grid(column=0, row=0)
-        self.image_label.pack(expand=True, fill=BOTH)
-        # This stops the frame from shrinking with the label
-        # Very weird, but it makes them have a constant size
-        self.pack_propagate(0)
-
-        self.image_label.bind('<Button-1>', self.handle_click)
-
-        self.count_label = tk.Label(
-            self, bg="#a6a6a6", text="", borderwidth=1, relief='solid')
-        self.count_label.place(relx=1.0, rely=1.0, x=-2, y=-2, anchor="se")
-        self.count_label.place_forget()
+        # Items by slot, including any for slots that aren't drawn so they
+        # are kept when saving
+        self.items = {}
+        # (image item, count item) by slot
+        self.canvas_items = {}
+        # Canvas item id of each slot's rectangle back to the slot
+        self.slot_of_rect = {}
+        # What each slot currently shows: (id, count), or None when empty
+        self.drawn = {}
+        self.dirty = set()
+        self.redraw_pending = False
+
+        for slot, (c, r) in SLOT_POSITIONS.items():
+            l = c * SLOT_PITCH + SLOT_PADDING
+            t = r * SLOT_PITCH + SLOT_PADDING
+            rect = self.create_rectangle(
+                l, t, l + SLOT_SIZE, t + SLOT_SIZE,
+                fill=SLOT_COLOUR, outline="")
+            image = self.create_image(
+                l + SLOT_SIZE // 2, t + SLOT_SIZE // 2, state='hidden')
+            count = self.create_text(
+                l + SLOT_SIZE - 2, t + SLOT_SIZE - 2, anchor='se',
+                state='hidden')
+            self.slot_of_rect[rect] = slot
+            self.canvas_items[slot] = (image, count)
+            self.items[slot] = Item(slot=slot)
+            self.drawn[slot] = None
+
+        self.bind('<Button-1>', self.handle_click)
+
+    def slot_at(self, x, y):
+        # The drawn slot under canvas position x, y, or None
+        for canvas_item in self.find_overlapping(x, y, x, y):
+            if canvas_item in self.slot_of_rect:
+                return self.slot_of_rect[canvas_item]
+        return None
 
     def handle_click(self, event):
+        slot = self.slot_at(event.x, event.y)
+        if slot is None:
+            return
         self.popup_window = ModifyItemPopupWindow(
             None,
             self,
-            self.item,
-            # self.on_save
-            self.update_display
+            self.items[slot],
+            lambda: self.mark_dirty(slot)
         )
 
-    # def set_image(self, img: tk.PhotoImage):
-    #     self.image_label.configure(image=img)
-    def update_display(self):
+    def mark_dirty(self, slot):
+        self.dirty.add(slot)
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self.redraw)
+
+    def set_items(self, items: List[Item]):
+        # Replaces every item in the grid. Only slots that had or now have
+        # an item are marked dirty.
+        old_items = self.items
+        self.items = {slot: Item(slot=slot) for slot in SLOT_POSITIONS}
+        for item in items:
+            self.items[item.slot] = item
+        for slot, item in old_items.items():
+            if item.is_valid():
+                self.mark_dirty(slot)
+        for item in items:
+            self.mark_dirty(item.slot)
+
+    def get_items(self) -> List[Item]:
+        # Empty or invalid drawn slots are left out. Items in slots the grid
+        # doesn't draw (modded or unexpected slots) can't be edited here and
+        # are returned as loaded, so saving doesn't drop them.
+        return [item for slot, item in self.items.items()
+                if slot not in SLOT_POSITIONS or item.is_valid()]
+
+    def redraw(self):
         global itemSpriteHandler
-        if self.item.is_valid():
-            self.image_label.configure(
-                image=itemSpriteHandler.get_image(self.item.id))
-            self.count_label.configure(text=str(self.item.count))
-            self.count_label.place(relx=1.0, rely=1.0, x=-2, y=-2, anchor="se")
-        else:
-            self.image_label.configure(image=None)
-            self.count_label.configure(text="")
-            self.count_label.place_forget()
-
-    def set_item(self, item: Item):
-        self.item = item
-        # if self.item.id != None:
-        #     self.set_image(self.item.id)
-        # else:
-        #     # TODO: This might give error
-        #     self.set_image(None)
-
-    def on_save(self):
-        self.set_image(itemSpriteHandler.get_image(self.item.id))
+        self.redraw_pending = False
+        dirty, self.dirty = self.dirty, set()
+        for slot in dirty:
+            if slot not in self.canvas_items:
+                continue
+            item = self.items[slot]
+            shown = (item.id, item.count) if item.is_valid() else None
+            if shown == self.drawn[slot]:
+                continue
+            self.drawn[slot] = shown
+
+            image, count = self.canvas_items[slot]
+            if shown is None:
+                self.itemconfigure(image, state='hidden')
+                self.itemconfigure(count, state='hidden')
+            else:
+                # get_image keeps one PhotoImage per sprite, so showing an id
+                # again reuses the same handle
+                self.itemconfigure(
+                    image, image=itemSpriteHandler.get_image(item.id) or '',
+                    state='normal')
+                self.itemconfigure(count, text=str(item.count), state='normal')
 
 
 class App(tk.Frame):
@@ -211,35 +304,9 @@ class App(tk.Frame):
         # self.grid(columnspan=9, rowspan=8, ipadx=10, ipady=10)
         self.grid()
 
-        # Add all of the item slots
-        self.itemslots = {}
-
-        #self.itemSpriteHandler = ItemSpriteHandler()
-
-        # Add the armour slots
-        slot_num = 103
-        for r in range(0, 4):
-            self.itemslots[slot_num] = ItemSlot(self, r, 0, slot_num)
-            slot_num -= 1
-
-        # Add the shield slot
-        self.itemslots[slot_num] = ItemSlot(self, 3, 4, -106)
-
-        # Now the 3 main inventory rows
-        startr = 4
-        slot_num = 9
-        for r in range(0, 3):
-            for c in range(0, 9):
-                self.itemslots[slot_num] = ItemSlot(
-                    self, r + startr, c, slot_num)
-                slot_num += 1
-
-        # The equip row
-        startr = 7
-        slot_num = 0
-        for c in range(0, 9):
-            self.itemslots[slot_num] = ItemSlot(self, startr, c, slot_num)
-            slot_num += 1
+        # All of the item slots
+        self.inventory_grid = InventoryGrid(self)
+        self.inventory_grid.grid(row=0, column=0, padx=5, pady=5)
 
         # VARIABLES
         # TODO: Should be put at the top
@@ -251,7 +318,7 @@ class App(tk.Frame):
         self.var_load_path = tk.StringVar(self, '', name='Load Path')
 
         self.input_frame = tk.Frame(self)
-        self.input_frame.grid(row=0, rowspan=3, column=5, columnspan=3)
+        self.input_frame.grid(row=0, column=1, sticky='n', padx=5, pady=5)
 
         # Create the save and load file location inputs
         self.text_save_location = tk.Entry(
@@ -289,7 +356,118 @@ class App(tk.Frame):
         # self.button_load.grid(row = 2, column=5, columnspan=3, sticky='nsew')
         self.button_load.pack(fill=BOTH, expand=True)
 
+        # Loading and saving run on a worker thread so the window stays
+        # responsive. Each task gets a new generation number and only the
+        # latest one's result is used, so cancelling just moves the
+        # generation on and whatever the old task returns is dropped.
+        # Saves are the exception: nothing else starts while one runs, so
+        # whether the file was written is always shown.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.generation = 0
+        self.task = None
+        self.save_task = None
+
+        self.var_status = tk.StringVar(self, '', name='Status')
+        self.progress = ttk.Progressbar(self.input_frame, mode='indeterminate')
+        self.progress.pack(fill=BOTH, expand=True)
+        self.label_status = tk.Label(self.input_frame,
+                                     textvariable=self.var_status)
+        self.label_status.pack(fill=BOTH, expand=True)
+        self.button_cancel = tk.Button(
+            self.input_frame,
+            text="Cancel",
+            state=DISABLED,
+            command=self.cancel)
+        self.button_cancel.pack(fill=BOTH, expand=True)
+
+        # Folder mode lists every player file in a folder. The files around
+        # the selected one are parsed in the background into parse_cache,
+        # so stepping to the next or previous player doesn't have to wait.
+        self.parse_cache = ParseCache(PARSE_CACHE_BYTES)
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=2)
+        self.prefetches = []
+        self.player_files = []
+        self.player_index = None
+
+        self.browser_frame = tk.Frame(self)
+        self.browser_frame.grid(row=0, column=2, sticky='ns', padx=5, pady=5)
+        self.button_open_folder = tk.Button(
+            self.browser_frame,
+            text="Open Player Folder",
+            command=self.open_folder)
+        self.button_open_folder.pack(fill='x')
+        self.list_players = tk.Listbox(self.browser_frame, exportselection=False)
+        self.list_players.pack(fill=BOTH, expand=True)
+        self.list_players.bind('<<ListboxSelect>>', self.handle_player_select)
+        self.button_previous = tk.Button(
+            self.browser_frame,
+            text="Previous",
+            command=lambda: self.step_player(-1))
+        self.button_previous.pack(side='left', fill='x', expand=True)
+        self.button_next = tk.Button(
+            self.browser_frame,
+            text="Next",
+            command=lambda: self.step_player(1))
+        self.button_next.pack(side='left', fill='x', expand=True)
+
+    def run_task(self, status, work, on_done):
+        # Runs work() on the worker thread and on_done(result) back on the
+        # Tk thread once it finishes, unless it was cancelled or replaced
+        self.generation += 1
+        generation = self.generation
+        future = self.executor.submit(work)
+        self.task = future
+        self.var_status.set(status)
+        self.progress.start(10)
+        self.button_cancel.configure(state=tk.NORMAL)
+
+        def poll():
+            if generation != self.generation:
+                return
+            if not future.done():
+                self.after(20, poll)
+                return
+            self.finish_task()
+            try:
+                result = future.result()
+            except Exception as e:
+                self.var_status.set(f"Failed: {type(e).__name__}: {e}")
+                return
+            on_done(result)
+
+        self.after(20, poll)
+        return future
+
+    def finish_task(self):
+        self.task = None
+        self.save_task = None
+        self.progress.stop()
+        self.button_cancel.configure(state=DISABLED)
+
+    def saving(self):
+        # True, with a message, while a save is queued or running
+        if self.save_task is None:
+            return False
+        self.var_status.set("Wait for the save to finish.")
+        return True
+
+    def cancel(self):
+        if self.task is None:
+            return
+        # A task that hasn't started yet never runs. A load that has started
+        # still finishes on the worker, its result is just ignored. A save
+        # that has started can't be stopped, so it's left to report whether
+        # it wrote the file.
+        if not self.task.cancel() and self.task is self.save_task:
+            self.var_status.set("The save has already started, it can't be cancelled.")
+            return
+        self.generation += 1
+        self.finish_task()
+        self.var_status.set("Cancelled.")
+
     def save(self):
+        if self.saving():
+            return
         file_to_save = self.var_save_path.get()
         save_path = Path(file_to_save)
         if not save_path.exists() or not save_path.is_file():
@@ -299,40 +477,119 @@ class App(tk.Frame):
             print("Cannot save: an inventory file has not been loaded yet.")
             return
 
-        print("Saving...")
-        items = []
-        for itemslot in self.itemslots:
-            item = self.itemslots[itemslot].item
-            if item.is_valid():
-                items.append(item)
-                print(item)
+        # Copies, so editing slots while the save runs doesn't change what
+        # gets written
+        items = [Item(item.slot, item.count, item.id)
+                 for item in self.inventory_grid.get_items()]
+        handler = self.inventoryHandler
 
-        self.inventoryHandler.write_items(items, save_path)
+        def work():
+            # Refuses to save anything that wouldn't read back the same
+            handler.write_items(items, save_path, verify=True)
 
-    def load(self):
-        # TODO: Since this is modifying the item slots, we should probably
-        # empty them all first (so we don't get remaining data from a
-        # previously loaded file).
-        for itemslot in self.itemslots:
-            self.itemslots[itemslot].item = Item(itemslot)
+        self.save_task = self.run_task(
+            "Saving...", work,
+            lambda result: self.var_status.set(f"Saved {save_path.name}."))
 
+    def load(self):
+        if self.saving():
+            return
         file_to_load = self.var_load_path.get()
         load_path = Path(file_to_load)
         if not load_path.exists() or not load_path.is_file():
             print("The load path must be an existing file.")
             return
 
-        print("Loading...")
-        self.inventoryHandler = InventoryHandler(load_path)
-        invItems = self.inventoryHandler.get_items()
-        for item in invItems:
-            # self.itemslots[item.slot].item = item
-            self.itemslots[item.slot].set_item(item)
-            # self.itemslots[item.slot].set_image(
-            #     self.itemSpriteHandler.get_image(item.id)
-            # )
-            self.itemslots[item.slot].update_display()
-            print(item)
+        self.load_file(load_path)
+
+    def load_file(self, load_path: Path, on_done=None):
+        def work():
+            with Profiler.phase('gui-load'):
+                handler = self.parse_cache.load(load_path)
+                return handler, handler.get_items()
+
+        def loaded(result):
+            self.on_loaded(result)
+            if on_done is not None:
+                on_done()
+
+        if load_path in self.parse_cache:
+            status = f"Loading {load_path.name} (cached)..."
+        else:
+            status = f"Loading {load_path.name}..."
+        self.run_task(status, work, loaded)
+
+    def on_loaded(self, result):
+        self.inventoryHandler, invItems = result
+        # Empties the slots from any previous file too, the grid redraws
+        # every changed slot together
+        self.inventory_grid.set_items(invItems)
+        self.var_status.set(f"Loaded {len(invItems)} items.")
+
+    def open_folder(self):
+        if self.saving():
+            return
+        folder = askdirectory()
+        if not folder:
+            return
+        self.player_files = sorted(Path(folder).glob('*.dat'))
+        self.player_index = None
+        self.list_players.delete(0, tk.END)
+        for player_file in self.player_files:
+            self.list_players.insert(tk.END, player_file.stem)
+        self.var_status.set(f"{len(self.player_files)} players in {folder}")
+        if self.player_files:
+            self.select_player(0)
+
+    def handle_player_select(self, event):
+        selection = self.list_players.curselection()
+        if not selection:
+            return
+        if self.saving():
+            # Puts the selection back on the player being saved
+            self.list_players.selection_clear(0, tk.END)
+            if self.player_index is not None:
+                self.list_players.selection_set(self.player_index)
+            return
+        self.select_player(selection[0])
+
+    def step_player(self, step: int):
+        selection = self.list_players.curselection()
+        if not self.player_files or not selection:
+            return
+        index = selection[0] + step
+        if 0 <= index < len(self.player_files):
+            self.select_player(index)
+
+    def select_player(self, index: int):
+        # Also switches the save path, so not while a save is running
+        if self.saving():
+            return
+        self.player_index = index
+        player_file = self.player_files[index]
+        self.list_players.selection_clear(0, tk.END)
+        self.list_players.selection_set(index)
+        self.list_players.see(index)
+        # Saving writes back to the selected player
+        self.var_load_path.set(str(player_file))
+        self.var_save_path.set(str(player_file))
+        self.load_file(player_file, lambda: self.prefetch_around(index))
+
+    def prefetch_around(self, index: int):
+        # Parses the neighbours of index into the cache, nearest first.
+        # Prefetches queued for an earlier position that haven't started are
+        # dropped. Errors are left for when the file is actually opened.
+        for future in self.prefetches:
+            future.cancel()
+        self.prefetches = []
+        for distance in range(1, PREFETCH_COUNT + 1):
+            for neighbour in (index + distance, index - distance):
+                if not 0 <= neighbour < len(self.player_files):
+                    continue
+                player_file = self.player_files[neighbour]
+                if player_file not in self.parse_cache:
+                    self.prefetches.append(self.prefetch_executor.submit(
+                        self.parse_cache.load, player_file))
 
     def get_save_location(self):
         self.save_path = Path(askopenfilename())
@@ -350,6 +607,10 @@ itemSpriteHandler = None
 
 def main():
     global itemSpriteHandler
+    # --profile prints where load and save time went when the window closes
+    profile = '--profile' in sys.argv[1:]
+    if profile:
+        Profiler.enable()
     root = tk.Tk()
     root.title("MC Inventory Editor")
     root.minsize(800, 600)
@@ -359,6 +620,10 @@ def main():
     itemSpriteHandler = ItemSpriteHandler()
     app = App(root)
     app.mainloop()
+    app.executor.shutdown(wait=True, cancel_futures=True)
+    app.prefetch_executor.shutdown(wait=True, cancel_futures=True)
+    if profile:
+        print(Profiler.stats.report())
 
 
 if __name__ == '__main__':